@@ -0,0 +1,122 @@
+# Description:
+# Defines an index of the verified transactions by public key. For each key it keeps the
+# outputs the key can spend, its balance and the transactions that changed its balance, and
+# it is updated incrementally as blocks are added to or rolled back from the blockchain, so
+# a wallet or explorer query costs time in proportion to the size of its answer instead of
+# the length of the chain.
+
+from itertools import islice
+
+
+def page(items, offset, total):
+    # a page of the results of a query, with the offset of the next page (None after the last page)
+    next = offset + len(items)
+    return {'items': items, 'total': total, 'next': next if next < total else None}
+
+
+class AddressIndex:
+
+    def __init__(self):
+        # the outputs each key can spend, in the order they were received : {public key : {transaction id : amount}}
+        self.unspent = {}
+        # the sum of the outputs each key can spend : {public key : amount}
+        self.balances = {}
+        # the transactions that changed the balance of each key, in chain order :
+        # {public key : [(transaction id, height of its block, change in balance)]}
+        self.history = {}
+        # the outputs spent by each indexed transaction, so that remove can give them back :
+        # {transaction id : [(public key, spent transaction id, amount)]}
+        self.spends = {}
+
+    def from_utxo_set(utxo_set):
+        # index the outputs left unspent in a utxo set (when the network starts from a snapshot)
+        # the history only starts at the snapshot
+        index = AddressIndex()
+        for id, output in utxo_set.outputs.items():
+            if utxo_set.is_unspent(id):
+                for key, amount in output.items():
+                    index.receive(key, id, amount)
+        return index
+
+    def add(self, transaction, height, utxo_set):
+        # index a transaction added to the blockchain at height, whose outputs are in the utxo set
+        changes = {}
+        spends = []
+        for input in transaction.input:
+            # as in the utxo set, the genesis outputs can be spent by more than one transaction,
+            # so they are never removed (and their owners do not have to be found by signature)
+            if input == utxo_set.genesis_id:
+                continue
+            # every other output pays a single key, which is the only key that can spend it
+            output = utxo_set.get(input) or {}
+            if len(output) != 1:
+                continue
+            key = next(iter(output))
+            amount = self.spend(key, input)
+            if amount is not None:
+                spends.append((key, input, amount))
+                changes[key] = changes.get(key, 0) - amount
+        for key, amount in transaction.output.items():
+            self.receive(key, transaction.id, amount)
+            changes[key] = changes.get(key, 0) + amount
+        for key, change in changes.items():
+            self.history.setdefault(key, []).append((transaction.id, height, change))
+        self.spends[transaction.id] = spends
+
+    def remove(self, transaction):
+        # undo add when a transaction is rolled back from the blockchain
+        id = transaction.id
+        for key in transaction.output:
+            self.spend(key, id)
+        spends = self.spends.pop(id, [])
+        for key, input, amount in spends:
+            self.receive(key, input, amount)
+        for key in set(transaction.output).union(key for key, input, amount in spends):
+            history = self.history.get(key)
+            if history and history[-1][0] == id:
+                history.pop()
+                if len(history) == 0:
+                    del self.history[key]
+
+    def receive(self, key, id, amount):
+        self.unspent.setdefault(key, {})[id] = amount
+        self.balances[key] = self.balances.get(key, 0) + amount
+
+    def spend(self, key, id):
+        # remove an output from the outputs a key can spend, returning its amount (None if it was not there)
+        outputs = self.unspent.get(key)
+        if outputs is None or id not in outputs:
+            return None
+        amount = outputs.pop(id)
+        if len(outputs) == 0:
+            del self.unspent[key]
+        self.balances[key] -= amount
+        if self.balances[key] == 0:
+            del self.balances[key]
+        return amount
+
+    # functions that answer queries
+    def balance(self, key):
+        return self.balances.get(key, 0)
+
+    def unspent_outputs(self, key, offset=0, limit=100):
+        # a page of the outputs a key can spend, oldest first : items are (transaction id, amount)
+        # (the outputs before offset are skipped over, so later pages cost a little more than the first)
+        outputs = self.unspent.get(key, {})
+        return page(list(islice(outputs.items(), offset, offset + limit)), offset, len(outputs))
+
+    def transactions(self, key, offset=0, limit=100, newest_first=True):
+        # a page of the transactions that changed the balance of a key : items are (transaction id, height, change)
+        history = self.history.get(key, [])
+        if newest_first:
+            end = max(len(history) - offset, 0)
+            items = history[max(end - limit, 0):end][::-1]
+        else:
+            items = history[offset:offset + limit]
+        return page(items, offset, len(history))
+
+    def __contains__(self, key):
+        return key in self.history or key in self.unspent
+
+    def __len__(self):
+        return len(self.history)
@@ -0,0 +1,145 @@
+# Description:
+# Runs nodes as coroutines on one asyncio event loop instead of one thread each, so that a
+# single process can simulate thousands of full and light nodes sharing a network. Waiting
+# for the pools to change is a future that the network resolves when it notifies, and the
+# proof of work is searched in bounded slices on an executor, so the event loop is never
+# blocked for longer than one slice and a node notices a new block between slices.
+
+from node import Node
+from miner import Miner
+from block import Block
+import hashing
+
+import asyncio
+import concurrent.futures
+import os
+
+
+class Runtime:
+
+    def __init__(self, network, executor=None, slice_size=2**14):
+        self.network = network
+        # searches the slices of nonces (a process pool, so that the hashing runs on every core)
+        self.executor = executor if executor is not None else concurrent.futures.ProcessPoolExecutor(os.cpu_count() or 1)
+        # number of nonces searched by one call to the executor
+        self.slice_size = slice_size
+        self.loop = None
+        # futures of the coroutines waiting for the network to change
+        self.waiters = []
+        # whether a wake up is already scheduled : the network notifies on every change, and the
+        # waiters only need to be woken once for all of the changes made before they run
+        self.wake_scheduled = False
+        self.stopped = False
+        network.subscribe_changes(self.on_change)
+
+    def attach(self, loop):
+        self.loop = loop
+
+    def on_change(self):
+        # called by the network, possibly from another thread
+        if self.loop is not None and not self.wake_scheduled and not self.loop.is_closed():
+            self.wake_scheduled = True
+            self.loop.call_soon_threadsafe(self.wake)
+
+    def wake(self):
+        self.wake_scheduled = False
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def wait_for(self, predicate):
+        # wait until predicate() is true, checking it each time the network changes
+        while not predicate():
+            waiter = self.loop.create_future()
+            self.waiters.append(waiter)
+            await waiter
+
+    async def search(self, prefix, start, count, target):
+        # search a slice of nonces on the executor (see hashing.search)
+        return await self.loop.run_in_executor(self.executor, hashing.search, prefix, start, count, target)
+
+    def stop(self):
+        self.stopped = True
+        self.wake()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+class AsyncNode(Node):
+    # a node whose main loop, chain sync and waits are coroutines on the runtime's event loop
+
+    def __init__(self, network, runtime, block_size=100):
+        # the miner only hands out the ranges; the runtime's executor searches them
+        super().__init__(network, Miner(0, runtime.slice_size), block_size)
+        self.runtime = runtime
+
+    async def run(self):
+        while not self.simulation_finished:
+            # update the local chain
+            await self.sync()
+            # if no transaction is ready to be mined, wait
+            await self.runtime.wait_for(lambda: self.simulation_finished or self.network.unverified_transaction_pool.has_ready())
+            if self.simulation_finished:
+                break
+            # claim the transactions with the highest priority that no other node is working on
+            version = self.network.version
+            transactions = self.network.claim_transactions(self, self.block_size)
+            if len(transactions) == 0:
+                # all of the ready transactions are claimed by other nodes
+                await self.runtime.wait_for(lambda: self.simulation_finished or self.network.version != version)
+                continue
+            try:
+                block_transactions = self.verify_transactions(transactions)
+                if len(block_transactions) > 0:
+                    block = Block(block_transactions, self.local_chain[-1].id(), self.network.next_target())
+                    nonce, proof_of_work = await self.mine(block)
+                    if nonce is not None:
+                        block.seal(nonce, proof_of_work)
+                        self.network.push_block_vtp(block)
+            finally:
+                self.network.release_transactions(transactions, self)
+        await self.sync()
+
+    async def sync(self):
+        self.update_local_chain()
+        # let the other nodes run between syncs
+        await asyncio.sleep(0)
+
+    async def mine(self, block):
+        # return (None, None) if another node added a block first or the node was stopped
+        header = block.serialize_header()
+        target = block.target()
+        keep_mining = lambda: self.sync_height == self.network.chain_length() and not self.simulation_finished
+        for start, count in self.miner.ranges():
+            if not keep_mining():
+                break
+            nonce, proof_of_work, tried = await self.runtime.search(header, start, count, target)
+            self.miner.hashes += tried
+            if nonce is not None:
+                return (nonce, proof_of_work)
+        return (None, None)
+
+
+async def follow(light_node, runtime):
+    # keep a light node's headers in sync with the network
+    while not runtime.stopped:
+        version = runtime.network.version
+        light_node.update_headers()
+        await runtime.wait_for(lambda: runtime.stopped or runtime.network.version != version)
+
+
+async def simulate(network, nodes, light_nodes=(), until=lambda: False, runtime=None):
+    # run full nodes (AsyncNodes) and light nodes on the current event loop until until() is true
+    runtime = runtime or nodes[0].runtime
+    runtime.attach(asyncio.get_running_loop())
+    tasks = [asyncio.ensure_future(node.run()) for node in nodes]
+    tasks += [asyncio.ensure_future(follow(light_node, runtime)) for light_node in light_nodes]
+    try:
+        await runtime.wait_for(until)
+    finally:
+        for node in nodes:
+            node.stop()
+        runtime.stop()
+        await asyncio.gather(*tasks)
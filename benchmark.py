@@ -0,0 +1,381 @@
+# Description:
+# Benchmarks the network. Each scenario measures one part of it and reports its metrics:
+#   mining       hash rate of the proof of work engine for each number of workers
+#   validation   latency of Transaction.is_valid against the length of the chain
+#   double_spend latency of Network.is_double_spent against the size of the unverified pool
+#   address      latency of a wallet query (balance and first pages of unspent outputs and history)
+#                against the length of the chain
+#   catchup      time a new node takes to sync the chain with update_local_chain, from the
+#                genesis block and from a snapshot
+#   tps          confirmed transactions per second of the whole network against the number of nodes
+#   cluster      confirmed transactions per second and fork rate of nodes running in their own
+#                processes and gossiping over links with latency, against the number of nodes
+#   memory       bytes of memory held by each transaction loaded from a transaction file
+#   retarget     how far the block interval is from the configured one after the difficulty
+#                controller has retargeted from a target that is far too easy
+# The results are printed (or written) as JSON, and --compare checks them against the results
+# of an earlier run and fails if any metric got worse by more than the tolerance.
+# Metrics ending in _per_s are better when higher; the others are times, better when lower.
+# Metrics ending in _error and the _rate_ metrics are fractions that are noisy or often zero, so
+# they regress when they grow by more than the tolerance rather than by more than a fraction of
+# their old value.
+
+from miner import Miner
+from network import Network
+from node import Node
+from block import Block
+from user import User
+from snapshot import Snapshot
+from transport import Cluster
+from difficulty import DifficultyController
+import difficulty
+import simulation
+import transaction_file
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+# functions that build networks to benchmark against
+def quiet():
+    # the network and the nodes print as they work
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def clear_caches():
+    # forget the signatures verified while building, so that they are verified again when measured
+    User.signature_cache.clear()
+    User.verify_key_cache.clear()
+
+
+def workload(count, seed=0, users=100):
+    # a workload of valid transactions, in an order in which each one can be added after the ones before it
+    records = transaction_file.generate(users=users, count=count, double_spend_rate=0, invalid_signature_rate=0, seed=seed)
+    return (transaction_file.to_transaction(record) for record in records)
+
+
+def build_network(count, block_size=100, snapshot_height=None, snapshot_path=None, seed=0):
+    # build a network whose chain holds the genesis block and then count transactions in blocks of block_size
+    # (the blocks are sealed without proof of work, which the benchmarks do not measure : every hash meets the target)
+    network = Network(snapshot_path=snapshot_path, difficulty=DifficultyController(difficulty.MAX_TARGET))
+    transactions = workload(count, seed)
+    with quiet():
+        push_sealed_block(network, [next(transactions)], snapshot_height)
+        block_transactions = []
+        for transaction in transactions:
+            block_transactions.append(transaction)
+            if len(block_transactions) == block_size:
+                push_sealed_block(network, block_transactions, snapshot_height)
+                block_transactions = []
+        if len(block_transactions) > 0:
+            push_sealed_block(network, block_transactions, snapshot_height)
+    return network
+
+
+def push_sealed_block(network, transactions, snapshot_height=None):
+    block = Block(transactions, network.blockchain[-1].id() if network.chain_length() > 0 else None, network.next_target())
+    block.seal(0)
+    if not network.push_block_vtp(block):
+        raise RuntimeError("benchmark block was rejected")
+    if network.chain_length() == snapshot_height:
+        network.take_snapshot()
+
+
+# scenarios
+def bench_mining(num_workers, seconds):
+    # mine against an unreachable target for a fixed amount of time and count the hashes
+    miner = Miner(num_workers)
+    miner.start()
+    try:
+        deadline = time.time() + seconds
+        start = time.time()
+        miner.mine("benchmark", bytes(32), lambda: time.time() < deadline)
+        elapsed = time.time() - start
+    finally:
+        miner.close()
+    return miner.hashes / elapsed
+
+
+def scenario_mining(args):
+    results = {}
+    for num_workers in args.workers:
+        results['hashes_per_s_{}_workers'.format(num_workers)] = bench_mining(num_workers, args.seconds)
+    return results
+
+
+def scenario_validation(args):
+    # re-validate a sample of the transactions on the chain, as a node does when it syncs
+    results = {}
+    for size in args.sizes:
+        network = build_network(size)
+        sample = random.Random(0).sample(network.verified_transaction_pool[1:], min(args.samples, size))
+        clear_caches()
+        start = time.perf_counter()
+        with quiet():
+            for transaction in sample:
+                transaction.is_valid(network.unverified_transaction_pool, network.utxo_set)
+        results['is_valid_s_chain_{}'.format(size)] = (time.perf_counter() - start) / len(sample)
+    return results
+
+
+def scenario_address(args):
+    # query the balance, unspent outputs and history of every public key on the chain
+    results = {}
+    for size in args.sizes:
+        network = build_network(size)
+        # every key is queried several times, as there are only as many keys as users
+        keys = list(network.address_index.history) * 10
+        start = time.perf_counter()
+        for key in keys:
+            network.get_balance(key)
+            network.get_unspent_outputs(key, 0, 20)
+            network.get_address_history(key, 0, 20)
+        results['address_query_s_chain_{}'.format(size)] = (time.perf_counter() - start) / len(keys)
+    return results
+
+
+def scenario_double_spend(args):
+    # check every transaction of an unverified pool of each size for double spends
+    results = {}
+    for size in args.sizes:
+        network = build_network(0)
+        with quiet():
+            for id, accepted in network.ingest_transactions(workload(size)):
+                pass
+        transactions = list(network.unverified_transaction_pool.values())
+        start = time.perf_counter()
+        for transaction in transactions:
+            network.is_double_spent(transaction)
+        results['is_double_spent_s_pool_{}'.format(size)] = (time.perf_counter() - start) / len(transactions)
+    return results
+
+
+def sync_node(network, snapshot=None):
+    # time how long a new node takes to sync the chain
+    clear_caches()
+    start = time.perf_counter()
+    with quiet():
+        node = Node(network, Miner(1), snapshot=snapshot() if snapshot is not None else None)
+        node.update_local_chain()
+    return time.perf_counter() - start
+
+
+def scenario_catchup(args):
+    # compare a node that replays the whole chain with one that starts from a snapshot taken args.tail blocks before the tip
+    results = {}
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'snapshot')
+            num_blocks = 1 + -(-size // args.block_size)
+            network = build_network(size, args.block_size, max(1, num_blocks - args.tail), path)
+            commitment = network.latest_snapshot.commitment()
+            results['catchup_s_chain_{}'.format(size)] = sync_node(network)
+            results['catchup_s_chain_{}_from_snapshot'.format(size)] = sync_node(network, lambda: Snapshot.load(path, commitment))
+    return results
+
+
+def scenario_tps(args):
+    # start the nodes on a pool of valid transactions and time them until every transaction is on the chain
+    results = {}
+    for num_nodes in args.nodes:
+        network = build_network(0)
+        network.difficulty = DifficultyController(difficulty.target_for_zeros(args.difficulty))
+        with quiet():
+            for id, accepted in network.ingest_transactions(workload(args.transactions)):
+                pass
+            start = time.perf_counter()
+            nodes, threads = simulation.create_nodes(network, num_nodes)
+            try:
+                confirmed = network.wait_for_length(args.transactions + 1, args.timeout)
+                elapsed = time.perf_counter() - start
+            finally:
+                simulation.kill_nodes(nodes, threads)
+        if not confirmed:
+            print("tps: {} nodes did not confirm every transaction within {}s".format(num_nodes, args.timeout), file=sys.stderr)
+        results['tps_per_s_{}_nodes'.format(num_nodes)] = (network.transaction_count() - 1) / elapsed
+    return results
+
+
+def scenario_cluster(args):
+    # hand the transactions to nodes in their own processes and time them until every node has them all on its chain
+    results = {}
+    for num_nodes in args.nodes:
+        transactions = workload(args.transactions)
+        genesis = Block([next(transactions)])
+        genesis.seal(0)
+        cluster = Cluster(num_nodes, args.degree, args.latency, args.bandwidth, args.difficulty)
+        cluster.start(genesis)
+        try:
+            start = time.perf_counter()
+            for transaction in transactions:
+                cluster.submit(transaction)
+            stats = cluster.wait_for_transactions(args.transactions + 1, args.timeout)
+            elapsed = time.perf_counter() - start
+        finally:
+            cluster.stop()
+        confirmed = min(stat['transactions'] for stat in stats) - 1
+        if confirmed < args.transactions:
+            print("cluster: {} nodes did not confirm every transaction within {}s".format(num_nodes, args.timeout), file=sys.stderr)
+        results['cluster_tps_per_s_{}_nodes'.format(num_nodes)] = confirmed / elapsed
+        # the fraction of the mined blocks that ended up off the chain
+        results['cluster_fork_rate_{}_nodes'.format(num_nodes)] = max(stat['stale_blocks'] / stat['blocks_seen'] for stat in stats)
+        # the bytes sent between the nodes to propagate each confirmed transaction and its block
+        results['cluster_bytes_per_transaction_{}_nodes'.format(num_nodes)] = sum(stat['bytes_sent'] for stat in stats) / max(confirmed, 1)
+    return results
+
+
+def scenario_memory(args):
+    # load the transactions of a workload from their json lines, as they are read from a transaction file,
+    # and measure the memory they hold
+    lines = [json.dumps(record) for record in transaction_file.generate(count=args.transactions, double_spend_rate=0, invalid_signature_rate=0)]
+    tracemalloc.start()
+    try:
+        transactions = [transaction_file.to_transaction(json.loads(line)) for line in lines]
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return {'memory_bytes_per_transaction': size / len(transactions)}
+
+
+
+def scenario_retarget(args):
+    # mine a chain of empty blocks starting from a target 2 nibbles easier than --difficulty
+    # and measure how far the mean interval of the blocks mined once the controller has converged
+    # is from the block interval (block times are random, so a single window says little)
+    controller = DifficultyController(difficulty.target_for_zeros(args.difficulty - 2), args.block_interval, args.window)
+    miner = Miner(max(args.workers))
+    miner.start()
+    headers = []
+    try:
+        for height in range(args.window * args.windows + 1):
+            block = Block([], headers[-1]['proof_of_work'] if height > 0 else None, controller.next_target(height, headers.__getitem__))
+            nonce, proof_of_work = miner.mine(block.serialize_header(), block.target())
+            block.seal(nonce, proof_of_work)
+            headers.append(block.data['header'])
+    finally:
+        miner.close()
+    # the controller has converged from the first window whose retarget did not move the target by the most it can
+    targets = [difficulty.decode_target(headers[window * args.window]['target']) for window in range(args.windows)]
+    converged = next((window for window in range(2, args.windows)
+                      if 1.01 / controller.max_adjustment < targets[window] / targets[window - 1] < 0.99 * controller.max_adjustment), None)
+    if converged is None:
+        print("retarget: the controller did not converge within {} windows".format(args.windows), file=sys.stderr)
+        converged = args.windows - 1
+    start = converged * args.window
+    interval = (headers[-1]['timestamp'] - headers[start]['timestamp']) / 1000 / (len(headers) - 1 - start)
+    return {'retarget_interval_error': abs(interval - args.block_interval) / args.block_interval}
+
+
+SCENARIOS = {
+    'mining': scenario_mining,
+    'validation': scenario_validation,
+    'double_spend': scenario_double_spend,
+    'address': scenario_address,
+    'catchup': scenario_catchup,
+    'tps': scenario_tps,
+    'cluster': scenario_cluster,
+    'memory': scenario_memory,
+    'retarget': scenario_retarget
+}
+
+
+# functions that compare runs
+def higher_is_better(metric):
+    return '_per_s' in metric
+
+
+def is_fraction(metric):
+    # fractions are compared by their difference rather than their ratio (see the description)
+    return metric.endswith('_error') or '_rate_' in metric
+
+
+def compare(baseline, results, tolerance):
+    # return the metrics that got worse than the baseline by more than the tolerance (a fraction)
+    regressions = []
+    for scenario, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(scenario, {}).get(metric)
+            if old is None:
+                continue
+            # how many times worse the new value is (above 1 is worse)
+            if is_fraction(metric):
+                ratio = 1 + value - old
+            elif old == value:
+                ratio = 1.0
+            elif old == 0 or value == 0:
+                # a change from or to zero is infinitely better or worse
+                worse = value < old if higher_is_better(metric) else value > old
+                ratio = float('inf') if worse else 0.0
+            else:
+                ratio = old / value if higher_is_better(metric) else value / old
+            print("{:50s} {:>14.6g} {:>14.6g} {:>8.2f}x".format(scenario + '.' + metric, old, value, ratio), file=sys.stderr)
+            if ratio > 1 + tolerance:
+                regressions.append((scenario, metric, old, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="network benchmarks")
+    parser.add_argument("scenarios", nargs="*", help="scenarios to run, from {} (all of them if none are given)".format(", ".join(SCENARIOS)))
+    parser.add_argument("--output", default=None, help="file to write the JSON results to (printed if not given)")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="fraction by which a metric can get worse before it is a regression")
+    parser.add_argument("--seconds", type=float, default=5.0, help="time spent mining for each worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=None, help="worker counts to benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="chain and pool sizes, in transactions")
+    parser.add_argument("--samples", type=int, default=1000, help="transactions validated for each chain size")
+    parser.add_argument("--block-size", type=int, default=100, help="transactions per block in the catchup scenario")
+    parser.add_argument("--tail", type=int, default=10, help="blocks after the snapshot in the catchup scenario")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1, 2, 4], help="node counts for the tps scenario")
+    parser.add_argument("--transactions", type=int, default=1000, help="transactions confirmed in the tps scenario and loaded in the memory scenario")
+    parser.add_argument("--difficulty", type=int, default=5, help="proof of work difficulty in the tps and cluster scenarios")
+    parser.add_argument("--timeout", type=float, default=600, help="longest time to wait in the tps and cluster scenarios")
+    parser.add_argument("--degree", type=int, default=4, help="peers of each node in the cluster scenario")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds each message takes to cross a link in the cluster scenario")
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes per second of each link in the cluster scenario (unlimited if not given)")
+    parser.add_argument("--block-interval", type=float, default=0.1, help="seconds per block the retarget scenario aims for")
+    parser.add_argument("--window", type=int, default=32, help="blocks between retargets in the retarget scenario")
+    parser.add_argument("--windows", type=int, default=12, help="retarget windows mined in the retarget scenario")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario {}".format(name))
+
+    # by default, benchmark powers of two up to the number of cores
+    if args.workers is None:
+        args.workers = [1]
+        while args.workers[-1]*2 <= (os.cpu_count() or 1):
+            args.workers.append(args.workers[-1]*2)
+
+    results = {}
+    for name in args.scenarios or list(SCENARIOS):
+        print("running {}...".format(name), file=sys.stderr)
+        results[name] = SCENARIOS[name](args)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.tolerance)
+        for scenario, metric, old, value in regressions:
+            print("regression: {}.{} went from {:.6g} to {:.6g}".format(scenario, metric, old, value), file=sys.stderr)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# Description:
+# Defines the block data structure. A block batches many transactions under a Merkle root,
+# and a single header carrying the pointer to the previous block, the timestamp, the target,
+# the nonce and the proof of work is mined for the whole batch. The proof of work (the hash
+# of the header) is the id of the block, and must be at most the target in the header.
+
+from transaction import Transaction
+import merkle
+import serialization
+import hashing
+import difficulty
+
+
+class Block:
+
+    def __init__(self, transactions, ptr_prev=None, target=None, timestamp=None):
+        self.data = {
+            'header':
+            {
+                'ptr_prev': ptr_prev,                       # id of the block immediately before this one
+                'merkle_root': Block.compute_merkle_root(transactions),    # commits to the transactions of the block
+                'timestamp': difficulty.timestamp_now() if timestamp is None else timestamp,  # when the block was made, in milliseconds
+                'target': None if target is None else difficulty.encode_target(target),   # the proof of work must be at most the target
+                'nonce': 0,                                 # the guess that solved the proof of work
+                'proof_of_work': None                       # hash of the header, which is also the id of the block
+            },
+            'transactions': transactions
+        }
+
+    def from_data(header, transactions):
+        # rebuild a block that has already been sealed, without recomputing its merkle root
+        block = Block([])
+        block.data = {'header': dict(header), 'transactions': transactions}
+        return block
+
+    def id(self):
+        return self.data['header']['proof_of_work']
+
+    def target(self):
+        # the target of the block as 32 big-endian bytes, as the miner compares digests against it
+        return bytes.fromhex(self.data['header']['target'])
+
+    def compute_merkle_root(transactions):
+        return merkle.merkle_root([merkle.leaf_hash(transaction.serialize()) for transaction in transactions])
+
+    def serialize(self):
+        # encode the whole block, for storing it or sending it to other nodes
+        return serialization.encode({
+            'header': self.data['header'],
+            'transactions': [transaction.serialize() for transaction in self.data['transactions']]
+        })
+
+    def deserialize(data):
+        record = serialization.decode(data)
+        return Block.from_data(record['header'], [Transaction.deserialize(transaction) for transaction in record['transactions']])
+
+    def serialize_header(self):
+        return Block.encode_header(self.data['header'])
+
+    def encode_header(header):
+        # encode the part of the header that the nonce is appended to when mining
+        return serialization.encode({
+            'ptr_prev': header['ptr_prev'],
+            'merkle_root': header['merkle_root'],
+            'timestamp': header['timestamp'],
+            'target': header['target']
+        })
+
+    def seal(self, nonce, proof_of_work=None):
+        # set the nonce found by mining, and the proof of work (computed if it is not given)
+        if proof_of_work is None:
+            proof_of_work = hashing.proof_of_work(self.serialize_header(), nonce).hex()
+        self.data['header']['nonce'] = nonce
+        self.data['header']['proof_of_work'] = proof_of_work
+
+    def has_valid_structure(self):
+        # verify the structure of the header and that the merkle root commits to the transactions
+        if type(self.data['transactions']) != list: return False
+        if len(self.data['transactions']) < 1: return False
+        if type(self.data['header']['ptr_prev']) != str: return False
+        if type(self.data['header']['nonce']) != int: return False
+        if type(self.data['header']['timestamp']) != int: return False
+        if type(self.data['header']['target']) != str or len(self.data['header']['target']) != 64: return False
+        if type(self.data['header']['proof_of_work']) != str: return False
+        # the merkle tree pads an odd level by repeating its last hash, so a block that repeats its last
+        # transactions has the same root (and id) as the block without them : a block cannot hold a transaction twice
+        if len(set(transaction.id for transaction in self.data['transactions'])) != len(self.data['transactions']): return False
+        if self.data['header']['merkle_root'] != Block.compute_merkle_root(self.data['transactions']): return False
+        return True
+
+    def has_valid_proof_of_work(self):
+        return Block.header_has_valid_proof_of_work(self.data['header'])
+
+    def header_has_valid_proof_of_work(header):
+        # verify that the proof of work is the hash of the header and meets the target in the header
+        # (whether that target is the right one for the block's place in the chain is checked by the
+        # DifficultyController against the blocks before it)
+        # this only needs the header, so light nodes can check it without the transactions
+        nonce = header['nonce']
+        if type(nonce) != int or not 0 <= nonce < hashing.NONCE_SPACE:
+            return False
+        if type(header['target']) != str or len(header['target']) != 64:
+            return False
+        digest = hashing.proof_of_work(Block.encode_header(header), nonce)
+        if header['proof_of_work'] != digest.hex():
+            return False
+        return hashing.meets_target(digest, bytes.fromhex(header['target']))
+
+    def merkle_proof(self, index):
+        # get the proof that the transaction at the given index is committed to by the merkle root
+        leaves = [merkle.leaf_hash(transaction.serialize()) for transaction in self.data['transactions']]
+        return merkle.merkle_proof(leaves, index)
+
+    def display(self):
+        print("\n   block")
+        print("\tid:             {}".format(self.id()))
+        print("\tptr_prev:       {}".format(self.data['header']['ptr_prev']))
+        print("\tmerkle_root:    {}".format(self.data['header']['merkle_root']))
+        print("\ttimestamp:      {}".format(self.data['header']['timestamp']))
+        print("\ttarget:         {}".format(self.data['header']['target']))
+        print("\tnonce:          {}".format(self.data['header']['nonce']))
+        print("\ttransactions:   {}".format(len(self.data['transactions'])))
+        for transaction in self.data['transactions']:
+            transaction.display()
@@ -0,0 +1,113 @@
+# Description:
+# Defines a tree of every block a node has seen, keyed by the block each one points at.
+# Each block stores its height and cumulative work, and the tip of the best chain is
+# tracked as blocks are added, so fork choice never has to rescan the chain.
+
+
+class BlockTree:
+
+    def __init__(self, work=lambda block: 1):
+        # the amount of work done to produce a block
+        self.work = work
+        # every block in the tree : {block id : {'block', 'parent', 'height', 'work'}}
+        self.nodes = {}
+        # the blocks that point at each block : {ptr_prev : [block ids]}
+        self.children = {}
+        # the id of the block at the end of the chain with the most cumulative work
+        self.best_tip = None
+        # number of blocks that have more than one child
+        self.forks = 0
+
+    def add(self, block, parent=None):
+        # add a block whose parent is already in the tree (or the root, with parent None)
+        # return True if the block became the new best tip
+        id = block.id()
+        if id in self.nodes:
+            return False
+        if parent is not None and parent not in self.nodes:
+            raise KeyError("unknown parent block {}".format(parent))
+        if parent is None and len(self.nodes) > 0:
+            raise ValueError("the tree already has a root block")
+
+        height = 0 if parent is None else self.nodes[parent]['height'] + 1
+        work = self.work(block) + (0 if parent is None else self.nodes[parent]['work'])
+        self.nodes[id] = {'block': block, 'parent': parent, 'height': height, 'work': work}
+        siblings = self.children.setdefault(parent, [])
+        siblings.append(id)
+        if parent is not None and len(siblings) == 2:
+            self.forks += 1
+
+        # ties go to the block that was seen first
+        if self.best_tip is None or work > self.nodes[self.best_tip]['work']:
+            self.best_tip = id
+            return True
+        return False
+
+    def remove(self, id):
+        # remove a block and every block built on it (when the block turned out to be invalid)
+        # return the ids of the removed blocks
+        parent = self.nodes[id]['parent']
+        siblings = self.children[parent]
+        siblings.remove(id)
+        if parent is not None and len(siblings) == 1:
+            self.forks -= 1
+        removed = []
+        branch = [id]
+        while len(branch) > 0:
+            id = branch.pop()
+            del self.nodes[id]
+            children = self.children.pop(id, [])
+            if len(children) > 1:
+                self.forks -= 1
+            branch.extend(children)
+            removed.append(id)
+        if self.best_tip not in self.nodes:
+            # ties go to the block that was seen first, as in add
+            self.best_tip = None
+            for id, node in self.nodes.items():
+                if self.best_tip is None or node['work'] > self.nodes[self.best_tip]['work']:
+                    self.best_tip = id
+        return removed
+
+    def path_diff(self, old_tip, new_tip):
+        # find the blocks to remove from the chain ending at old_tip (ordered from old_tip backwards)
+        # and the blocks to add to reach new_tip (ordered from the common ancestor forwards)
+        # this costs time in proportion to the depth of the reorganisation, not the length of the chain
+        removed = []
+        added = []
+        while old_tip != new_tip:
+            old_height = -1 if old_tip is None else self.nodes[old_tip]['height']
+            new_height = -1 if new_tip is None else self.nodes[new_tip]['height']
+            if old_height >= new_height:
+                removed.append(self.nodes[old_tip]['block'])
+                old_tip = self.nodes[old_tip]['parent']
+            if new_height >= old_height:
+                added.append(self.nodes[new_tip]['block'])
+                new_tip = self.nodes[new_tip]['parent']
+        added.reverse()
+        return removed, added
+
+    def has_forks(self):
+        return self.forks > 0
+
+    def get(self, id, default=None):
+        # get a block in the tree by its id
+        node = self.nodes.get(id)
+        return node['block'] if node is not None else default
+
+    def height(self, id):
+        return self.nodes[id]['height']
+
+    def ancestor(self, id, height):
+        # get the block at a height on the branch ending at id
+        # this walks back from id, so it costs time in proportion to the distance between them
+        node = self.nodes[id]
+        while node['height'] > height:
+            node = self.nodes[node['parent']]
+        return node['block']
+
+    def __contains__(self, id):
+        return id in self.nodes
+
+    def __len__(self):
+        return len(self.nodes)
@@ -0,0 +1,214 @@
+# Description:
+# Defines an append-only store for the blocks of the blockchain, so that the chain survives
+# a restart and does not have to sit in memory. The store is a directory of three files:
+#   blocks.dat          the blocks, each one a 4-byte length followed by its canonical encoding
+#   blocks.idx          the offset of each block in blocks.dat, 8 bytes per block, by height
+#   transactions.idx    (hash of transaction id, height, index in the block), 40 bytes per transaction
+# A block is written to blocks.dat and transactions.idx before its offset is written to
+# blocks.idx, so the offset is the commit marker, and anything after the last offset is
+# cut off when the store is reopened. Reopening only reads the file sizes; the blocks are
+# read lazily through a memory map, and the transaction index is loaded on the first lookup.
+# The store can be used like the list of blocks it replaces (len, indexing, slicing,
+# iteration, append and pop).
+
+from block import Block
+from lru_cache import LRUCache
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+
+_LENGTH = struct.Struct('>I')
+_OFFSET = struct.Struct('>Q')
+_LOCATION = struct.Struct('>32sII')
+
+
+class ChainStore:
+
+    def __init__(self, path, cache_size=256, sync=False):
+        self.path = path
+        # fsync after every block, so that a block is on disk once append returns
+        self.sync = sync
+        os.makedirs(path, exist_ok=True)
+        self.segment = open(os.path.join(path, 'blocks.dat'), 'a+b')
+        self.block_index = open(os.path.join(path, 'blocks.idx'), 'a+b')
+        self.transaction_index = open(os.path.join(path, 'transactions.idx'), 'a+b')
+        # read-only memory maps of blocks.dat and blocks.idx, remapped when the files grow
+        self.segment_map = None
+        self.block_index_map = None
+        # the most recently read blocks : {height : block}
+        self.cache = LRUCache(cache_size)
+        # where each transaction is : {hash of transaction id : (height, index in the block)}, loaded on the first lookup
+        self.locations = None
+        self.lock = threading.RLock()
+        self.recover()
+
+    # functions that open and close the store
+    def recover(self):
+        # cut off a block that was only partly written when the store was last closed
+        self.count = os.fstat(self.block_index.fileno()).st_size // _OFFSET.size
+        self.block_index.truncate(self.count * _OFFSET.size)
+        end = 0
+        if self.count > 0:
+            offset = self.offset(self.count - 1)
+            self.segment.seek(offset)
+            end = offset + _LENGTH.size + _LENGTH.unpack(self.segment.read(_LENGTH.size))[0]
+        self.segment.truncate(end)
+        self.truncate_transaction_index(self.count)
+
+    def close(self):
+        with self.lock:
+            self.unmap()
+            self.segment.close()
+            self.block_index.close()
+            self.transaction_index.close()
+
+    def unmap(self):
+        if self.segment_map is not None:
+            self.segment_map.close()
+            self.segment_map = None
+        if self.block_index_map is not None:
+            self.block_index_map.close()
+            self.block_index_map = None
+
+    def view(self, file, current, size):
+        # get a memory map of a file that covers at least size bytes
+        if current is not None and len(current) >= size:
+            return current
+        if current is not None:
+            current.close()
+        file.flush()
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # functions that write blocks
+    def append(self, block):
+        with self.lock:
+            height = self.count
+            record = block.serialize()
+            self.segment.seek(0, os.SEEK_END)
+            offset = self.segment.tell()
+            self.segment.write(_LENGTH.pack(len(record)) + record)
+            locations = bytearray()
+            for index, transaction in enumerate(block.data['transactions']):
+                key = ChainStore.key(transaction.id)
+                locations += _LOCATION.pack(key, height, index)
+                if self.locations is not None:
+                    self.locations[key] = (height, index)
+            self.transaction_index.write(locations)
+            self.flush(self.segment, self.transaction_index)
+            # commit the block by writing its offset
+            self.block_index.write(_OFFSET.pack(offset))
+            self.flush(self.block_index)
+            self.count += 1
+            self.transaction_count += len(block.data['transactions'])
+            self.cache.put(height, block)
+
+    def pop(self):
+        # remove the last block from the store and return it
+        with self.lock:
+            if self.count == 0:
+                raise IndexError("pop from an empty chain store")
+            block = self[self.count - 1]
+            self.truncate(self.count - 1)
+            return block
+
+    def truncate(self, height):
+        # remove every block from the given height on
+        with self.lock:
+            if height >= self.count:
+                return
+            offset = self.offset(height)
+            # the maps must be closed before the files shrink under them
+            self.unmap()
+            self.block_index.truncate(height * _OFFSET.size)
+            self.flush(self.block_index)
+            self.segment.truncate(offset)
+            self.truncate_transaction_index(height)
+            self.flush(self.segment, self.transaction_index)
+            for removed in range(height, self.count):
+                self.cache.pop(removed)
+            self.count = height
+
+    def truncate_transaction_index(self, height):
+        # drop the index entries of the transactions in blocks from the given height on
+        # they are at the end of the file, so walk backwards until a lower block is found
+        size = os.fstat(self.transaction_index.fileno()).st_size
+        size -= size % _LOCATION.size
+        while size > 0:
+            self.transaction_index.seek(size - _LOCATION.size)
+            key, block_height, index = _LOCATION.unpack(self.transaction_index.read(_LOCATION.size))
+            if block_height < height:
+                break
+            if self.locations is not None and self.locations.get(key) == (block_height, index):
+                self.locations.pop(key)
+            size -= _LOCATION.size
+        self.transaction_index.truncate(size)
+        # number of transactions in the stored blocks
+        self.transaction_count = size // _LOCATION.size
+
+    def flush(self, *files):
+        for file in files:
+            file.flush()
+            if self.sync:
+                os.fsync(file.fileno())
+
+    # functions that read blocks
+    def offset(self, height):
+        self.block_index_map = self.view(self.block_index, self.block_index_map, (height + 1) * _OFFSET.size)
+        return _OFFSET.unpack_from(self.block_index_map, height * _OFFSET.size)[0]
+
+    def read(self, height):
+        # decode the block at the given height from the memory map
+        offset = self.offset(height)
+        self.segment_map = self.view(self.segment, self.segment_map, offset + _LENGTH.size)
+        length = _LENGTH.unpack_from(self.segment_map, offset)[0]
+        self.segment_map = self.view(self.segment, self.segment_map, offset + _LENGTH.size + length)
+        start = offset + _LENGTH.size
+        return Block.deserialize(self.segment_map[start:start+length])
+
+    def locate(self, transaction_id):
+        # get (height of the block, index in the block) of a stored transaction, or None
+        with self.lock:
+            if self.locations is None:
+                self.locations = {}
+                self.transaction_index.flush()
+                self.transaction_index.seek(0)
+                data = self.transaction_index.read()
+                for key, height, index in _LOCATION.iter_unpack(data[:len(data) - len(data) % _LOCATION.size]):
+                    self.locations[key] = (height, index)
+            return self.locations.get(ChainStore.key(transaction_id))
+
+    def get_transaction(self, transaction_id):
+        location = self.locate(transaction_id)
+        if location is None:
+            return None
+        return self[location[0]].data['transactions'][location[1]]
+
+    def key(transaction_id):
+        # transaction ids are hex strings, but any id is hashed down to a fixed-size key
+        return hashlib.sha256(transaction_id.encode('utf-8')).digest()
+
+    # list interface, so the store can be used like the list of blocks it replaces
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, height):
+        with self.lock:
+            if type(height) == slice:
+                return [self[i] for i in range(*height.indices(self.count))]
+            if height < 0:
+                height += self.count
+            if not 0 <= height < self.count:
+                raise IndexError("block height out of range")
+            block = self.cache.get(height)
+            if block is None:
+                block = self.read(height)
+                self.cache.put(height, block)
+            return block
+
+    def __iter__(self):
+        for height in range(len(self)):
+            yield self[height]
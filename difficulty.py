@@ -0,0 +1,83 @@
+# Description:
+# Defines the difficulty of the proof of work as a full 256-bit target : a block is valid if
+# the hash of its header, read as a big-endian number, is at most the target committed in
+# its header. The controller retargets every window blocks, scaling the target by how long
+# the last window blocks took compared to the configured block interval, so that blocks keep
+# arriving near that interval whatever the hashing power of the miners. Each header carries
+# its target, so a block is always checked against the target of its own place in the chain.
+
+import time
+
+MAX_TARGET = 2**256 - 1
+
+
+def target_for_zeros(min_zeros_msb):
+    # the target that a digest meets when it has min_zeros_msb leading zero nibbles
+    return MAX_TARGET >> min_zeros_msb*4
+
+
+def encode_target(target):
+    # the target as it is committed in a header : 32 big-endian bytes, in hex
+    return target.to_bytes(32, 'big').hex()
+
+
+def decode_target(encoded):
+    return int(encoded, 16)
+
+
+def work(target):
+    # the expected number of hashes needed to meet a target
+    return 2**256 // (target + 1)
+
+
+def block_work(block):
+    # the work done to produce a block, for fork choice (see BlockTree)
+    # the genesis block is not mined and has no target
+    target = block.data['header'].get('target')
+    return 1 if target is None else work(decode_target(target))
+
+
+def timestamp_now():
+    # the timestamp of a new block : milliseconds since the epoch
+    return int(time.time() * 1000)
+
+
+class DifficultyController:
+
+    def __init__(self, initial_target=target_for_zeros(5), block_interval=None, window=16, max_adjustment=4, max_future=120.0):
+        # the target of the first blocks, until the first retarget
+        self.initial_target = initial_target
+        # the number of seconds a block should take to mine (None keeps the target fixed)
+        self.block_interval = block_interval
+        # the number of blocks between retargets
+        self.window = window
+        # the most the target can be scaled up or down by in one retarget
+        self.max_adjustment = max_adjustment
+        # how far ahead of the local clock a block's timestamp can be (in seconds)
+        self.max_future = max_future
+
+    def parent_target(self, header):
+        target = header.get('target')
+        return self.initial_target if target is None else decode_target(target)
+
+    def next_target(self, height, header_at):
+        # the target of the block at height, given header_at(h), the header of the block at each height h < height
+        if height <= 1:
+            return self.initial_target
+        previous = self.parent_target(header_at(height - 1))
+        if self.block_interval is None or height % self.window != 0 or height <= self.window:
+            return previous
+        # the time the last window blocks took, in milliseconds, within max_adjustment of the expected time
+        expected = int(self.block_interval * self.window * 1000)
+        span = header_at(height - 1)['timestamp'] - header_at(height - 1 - self.window)['timestamp']
+        span = min(max(span, expected // self.max_adjustment), expected * self.max_adjustment)
+        return min(max(previous * span // expected, 1), MAX_TARGET)
+
+    def is_valid(self, header, height, header_at):
+        # check the target and timestamp of the header of a block at height, against the chain before it
+        if header['target'] != encode_target(self.next_target(height, header_at)):
+            return False
+        timestamp = header['timestamp']
+        if height > 0 and timestamp < header_at(height - 1)['timestamp']:
+            return False
+        return timestamp <= timestamp_now() + int(self.max_future * 1000)
@@ -0,0 +1,60 @@
+# Description:
+# Defines the hashing kernel used to mine and verify proofs of work. The fixed prefix
+# (the transaction) is hashed once, and the SHA-256 state is copied for every nonce,
+# which is appended as fixed-width bytes. The difficulty is checked by comparing the raw
+# digest with the target (see difficulty) as 32 big-endian bytes instead of converting it
+# to hex and back.
+
+import hashlib
+
+# the nonce is a 32-bit unsigned integer, appended to the prefix in big-endian byte order
+NONCE_SIZE = 4
+NONCE_SPACE = 2**(NONCE_SIZE*8)
+
+
+def prefix_state(prefix):
+    # hash the part of the message that does not change between nonces
+    if type(prefix) == str:
+        prefix = prefix.encode()
+    return hashlib.sha256(prefix)
+
+
+def nonce_bytes(nonce):
+    return nonce.to_bytes(NONCE_SIZE, 'big')
+
+
+def meets_target(digest, target):
+    # check that the digest is at most the target (both as 32 big-endian bytes)
+    # comparing them byte by byte is the same as comparing them as integers
+    return digest <= target
+
+
+def proof_of_work(prefix, nonce):
+    # get the proof of work for a single nonce
+    h = prefix_state(prefix)
+    h.update(nonce_bytes(nonce))
+    return h.digest()
+
+
+def has_valid_proof_of_work(prefix, nonce, target):
+    if type(nonce) != int or not 0 <= nonce < NONCE_SPACE:
+        return False
+    return meets_target(proof_of_work(prefix, nonce), target)
+
+
+def search(prefix, start, count, target, stop=None, check_every=4096):
+    # try every nonce in [start, start + count) and return (nonce, proof_of_work, tried) for the first
+    # nonce whose proof of work meets the target, or (None, None, tried) if there is none
+    # stop() is checked every check_every nonces so that the search can be abandoned early
+    copy = prefix_state(prefix).copy
+    end = min(start + count, NONCE_SPACE)
+    for chunk in range(start, end, check_every):
+        if stop is not None and stop():
+            return (None, None, chunk - start)
+        for nonce in range(chunk, min(chunk + check_every, end)):
+            h = copy()
+            h.update(nonce.to_bytes(NONCE_SIZE, 'big'))
+            digest = h.digest()
+            if digest <= target:
+                return (nonce, digest.hex(), nonce - start + 1)
+    return (None, None, end - start)
@@ -0,0 +1,82 @@
+# Description:
+# Defines a light node. It syncs only the block headers, checking that each one links to
+# the one before it, commits to the target set by the headers before it and carries a proof
+# of work that meets that target, and confirms a transaction by
+# checking a Merkle proof served by the network against the root in the header of the
+# block that holds it. It never downloads or re-validates the transactions themselves.
+
+from block import Block
+import merkle
+
+
+class LightNode:
+
+    def __init__(self, network):
+        self.network = network
+        # the headers of the chain, in order
+        self.headers = []
+        # height of each header in the chain : {block id : height}
+        self.heights = {}
+
+    def update_headers(self):
+        # sync the headers added to the network's chain since the last update
+        # return False if an invalid header was found (the headers before it are kept)
+        while True:
+            # the network's chain may have been rolled back (and grown back to the same length or shorter)
+            # since the last update : drop the headers that are no longer on it, going back from the tip
+            # (the headers before a header that is on the chain are on it too, as each one links to the one before)
+            while len(self.headers) > 0:
+                header = self.network.get_header(len(self.headers) - 1)
+                if header is not None and header['proof_of_work'] == self.headers[-1]['proof_of_work']:
+                    break
+                self.heights.pop(self.headers.pop()['proof_of_work'])
+            new_headers = self.network.headers_since(len(self.headers))
+            if len(new_headers) == 0:
+                return True
+            if len(self.headers) > 0 and new_headers[0]['ptr_prev'] != self.headers[-1]['proof_of_work']:
+                # the network's chain was rolled back past our tip : drop the tip and try again
+                self.heights.pop(self.headers.pop()['proof_of_work'])
+                continue
+            for header in new_headers:
+                if not self.has_valid_header(header):
+                    return False
+                self.heights[header['proof_of_work']] = len(self.headers)
+                self.headers.append(header)
+            return True
+
+    def has_valid_header(self, header):
+        # the genesis block is not mined
+        if len(self.headers) == 0:
+            return True
+        if header['ptr_prev'] != self.headers[-1]['proof_of_work']:
+            return False
+        if not self.network.difficulty.is_valid(header, len(self.headers), lambda height: self.headers[height]):
+            return False
+        return Block.header_has_valid_proof_of_work(header)
+
+    def verify_transaction(self, transaction):
+        # check that a transaction is in a block of the chain
+        # return the height of the block that holds it, or None if it could not be verified
+        located = self.network.get_merkle_proof(transaction.id)
+        if located is None:
+            return None
+        block_id, proof = located
+        if block_id not in self.heights:
+            self.update_headers()
+            if block_id not in self.heights:
+                return None
+        height = self.heights[block_id]
+        leaf = merkle.leaf_hash(transaction.serialize())
+        if not merkle.verify_proof(leaf, proof, self.headers[height]['merkle_root']):
+            return None
+        return height
+
+    def confirmations(self, transaction):
+        # number of blocks on top of the one that holds a transaction, counting that block
+        height = self.verify_transaction(transaction)
+        if height is None:
+            return 0
+        return len(self.headers) - height
+
+    def display(self):
+        print("light node : {} headers".format(len(self.headers)))
@@ -0,0 +1,163 @@
+# Description:
+# Defines the unverified transaction pool. Besides storing the transactions by id, it
+# tracks which transactions are ready to be mined (every input is confirmed) and which
+# are orphans (waiting on an input that is not on the chain yet), keeps the ready ones in
+# a heap ordered by a pluggable priority, and lets nodes claim transactions so that two
+# nodes do not mine the same one.
+# The pool is not thread-safe on its own; the Network guards it with its lock.
+
+import heapq
+import itertools
+
+
+# priorities : the ready transaction with the smallest key is mined first
+def by_age(transaction, received):
+    # oldest first
+    return received
+
+
+def by_value(transaction, received):
+    # largest output first, oldest first among equal outputs
+    return (-sum(transaction.output.values()), received)
+
+
+class Mempool:
+
+    def __init__(self, is_confirmed=lambda id: False, priority=by_age):
+        # is_confirmed(id) tells whether a transaction is on the chain
+        self.is_confirmed = is_confirmed
+        self.priority = priority
+        # the transactions in the pool : {transaction id : transaction}
+        self.transactions = {}
+        # the order the transactions were received in : {transaction id : sequence number}
+        self.received = {}
+        # number of unconfirmed inputs of each transaction : {transaction id : count}
+        self.missing = {}
+        # transactions in the pool that spend each input : {input id : set of transaction ids}
+        self.spenders = {}
+        # heap of (priority, sequence number, transaction id) for the ready transactions
+        # entries are removed lazily, so an entry is only used if it is still the transaction's current one
+        self.heap = []
+        self.entries = {}
+        # the claimed transactions : {transaction id : claimant}
+        self.claims = {}
+        self.counter = itertools.count()
+
+    # dict interface, so the pool can be used like the dict it replaces
+    def __getitem__(self, id):
+        return self.transactions[id]
+
+    def __setitem__(self, id, transaction):
+        self.add(transaction)
+
+    def __contains__(self, id):
+        return id in self.transactions
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def __iter__(self):
+        return iter(self.transactions)
+
+    def get(self, id, default=None):
+        return self.transactions.get(id, default)
+
+    def keys(self):
+        return self.transactions.keys()
+
+    def values(self):
+        return self.transactions.values()
+
+    def items(self):
+        return self.transactions.items()
+
+    def pop(self, id, *default):
+        if id not in self.transactions:
+            if len(default) > 0:
+                return default[0]
+            raise KeyError(id)
+        return self.remove(id)
+
+    # functions that add and remove transactions
+    def add(self, transaction):
+        id = transaction.id
+        if id in self.transactions:
+            self.remove(id)
+        self.transactions[id] = transaction
+        self.received[id] = next(self.counter)
+        inputs = set(transaction.input)
+        for input in inputs:
+            self.spenders.setdefault(input, set()).add(id)
+        self.missing[id] = sum(1 for input in inputs if not self.is_confirmed(input))
+        if self.missing[id] == 0:
+            self.push_ready(id)
+
+    def remove(self, id):
+        transaction = self.transactions.pop(id)
+        for input in set(transaction.input):
+            spenders = self.spenders.get(input)
+            if spenders is not None:
+                spenders.discard(id)
+                if len(spenders) == 0:
+                    self.spenders.pop(input)
+        self.received.pop(id)
+        self.missing.pop(id)
+        self.entries.pop(id, None)
+        self.claims.pop(id, None)
+        return transaction
+
+    # functions that track which transactions are ready
+    def confirm(self, id):
+        # a transaction was added to the chain : the transactions that spend it may now be ready
+        for spender in self.spenders.get(id, ()):
+            self.missing[spender] -= 1
+            if self.missing[spender] == 0 and spender not in self.claims:
+                self.push_ready(spender)
+
+    def unconfirm(self, id):
+        # a transaction was rolled back from the chain : the transactions that spend it are orphans again
+        for spender in self.spenders.get(id, ()):
+            self.missing[spender] += 1
+            self.entries.pop(spender, None)
+
+    def is_ready(self, id):
+        return self.missing.get(id) == 0
+
+    def dependants(self, id):
+        # the transactions in the pool that spend the output of a transaction
+        return list(self.spenders.get(id, ()))
+
+    def orphans(self):
+        return [self.transactions[id] for id, missing in self.missing.items() if missing > 0]
+
+    def push_ready(self, id):
+        entry = (self.priority(self.transactions[id], self.received[id]), next(self.counter), id)
+        self.entries[id] = entry
+        heapq.heappush(self.heap, entry)
+        # drop the stale entries once they outnumber the live ones
+        if len(self.heap) > 2*len(self.entries) + 64:
+            self.heap = list(self.entries.values())
+            heapq.heapify(self.heap)
+
+    # functions that let nodes share out the work
+    def claim(self, claimant):
+        # take the ready, unclaimed transaction with the highest priority, or None if there is none
+        while len(self.heap) > 0:
+            entry = heapq.heappop(self.heap)
+            id = entry[2]
+            if self.entries.get(id) is not entry:
+                continue
+            self.entries.pop(id)
+            self.claims[id] = claimant
+            return self.transactions[id]
+        return None
+
+    def release(self, id, claimant):
+        # give up a claimed transaction so that another node can mine it
+        if self.claims.get(id) is claimant:
+            self.claims.pop(id)
+            if self.is_ready(id):
+                self.push_ready(id)
+
+    def has_ready(self):
+        return len(self.entries) > 0
@@ -0,0 +1,50 @@
+# Description:
+# Computes Merkle roots over the transactions of a block, and the inclusion proofs that
+# let a light node check that a transaction is in a block from the block's header alone.
+# Leaves and inner nodes are hashed with different prefixes so that an inner node can
+# never be passed off as a leaf, and the last node of an odd-sized level is paired with itself.
+
+import hashlib
+
+
+def leaf_hash(data):
+    return hashlib.sha256(b'\x00' + data).digest()
+
+
+def node_hash(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def merkle_root(leaves):
+    # leaves is a list of leaf hashes; returns the root as a hex string
+    if len(leaves) == 0:
+        return hashlib.sha256(b'').hexdigest()
+    level = list(leaves)
+    while len(level) > 1:
+        if len(level) % 2 == 1:
+            level.append(level[-1])
+        level = [node_hash(level[i], level[i+1]) for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+
+def merkle_proof(leaves, index):
+    # get the path from a leaf to the root as a list of (sibling hash as hex, True if the sibling is on the left)
+    proof = []
+    level = list(leaves)
+    while len(level) > 1:
+        if len(level) % 2 == 1:
+            level.append(level[-1])
+        sibling = index ^ 1
+        proof.append((level[sibling].hex(), sibling < index))
+        level = [node_hash(level[i], level[i+1]) for i in range(0, len(level), 2)]
+        index //= 2
+    return proof
+
+
+def verify_proof(leaf, proof, root):
+    # check that a leaf hash is in the tree with the given root (as hex)
+    current = leaf
+    for sibling, is_left in proof:
+        sibling = bytes.fromhex(sibling)
+        current = node_hash(sibling, current) if is_left else node_hash(current, sibling)
+    return current.hex() == root
@@ -0,0 +1,135 @@
+# Description:
+# Defines a multi-process proof of work engine. The 32-bit nonce space is split into
+# ranges that are handed out to a pool of worker processes, and every worker stops
+# as soon as one of them finds a nonce whose proof of work meets the target. With no workers,
+# the ranges are searched one after another in the calling thread (for nodes that
+# already run in a process of their own).
+
+import hashing
+
+import multiprocessing
+import os
+import queue
+import random
+
+# the current job id, shared with every worker process of the pool
+_job = None
+
+
+def _init_worker(job):
+    global _job
+    _job = job
+
+
+def _search(job_id, prefix, start, count, target):
+    # search a range of nonces, returning early if the miner has moved on to a new job
+    # (another worker found a solution or mining was cancelled)
+    stop = lambda: _job is not None and _job.value != job_id
+    return hashing.search(prefix, start, count, target, stop)
+
+
+class Miner:
+
+    def __init__(self, num_workers=None, range_size=2**16):
+        # number of worker processes that search the nonce space in parallel (0 to search in the calling thread)
+        self.num_workers = (os.cpu_count() or 1) if num_workers is None else num_workers
+        # number of nonces handed to a worker at a time
+        self.range_size = range_size
+        # total number of hashes computed by this miner
+        self.hashes = 0
+
+        self.job = multiprocessing.Value('L', 0)
+        self.pool = None
+        # the outcomes of the ranges as they finish, tagged with their job id : (job id, outcome)
+        # (cancel puts (None, None) on it to wake up the mining loop, when there is a pool)
+        self.finished = queue.Queue()
+
+    def start(self):
+        if self.pool is None and self.num_workers > 0:
+            self.pool = multiprocessing.Pool(self.num_workers, initializer=_init_worker, initargs=(self.job,))
+
+    def close(self):
+        if self.pool is not None:
+            self.cancel()
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def cancel(self):
+        # move on to a new job so that all outstanding ranges stop early
+        with self.job.get_lock():
+            self.job.value += 1
+        # only the pool's mining loop waits on the queue (mine_here checks the job id instead)
+        if self.pool is not None:
+            self.finished.put((None, None))
+
+    def ranges(self):
+        # split the nonce space into ranges, starting at a random offset so that different miners
+        # working on the same transaction do not repeat each other's work
+        offset = random.randrange(hashing.NONCE_SPACE)
+        for start in range(0, hashing.NONCE_SPACE, self.range_size):
+            start = (start + offset) % hashing.NONCE_SPACE
+            yield (start, min(self.range_size, hashing.NONCE_SPACE - start))
+
+    def mine(self, prefix, target, keep_mining=lambda: True):
+        # return (nonce, proof_of_work) if a worker found a solution
+        # return (None, None) if mining was stopped or the nonce space was exhausted
+        # mining is cancelled by cancel() (from any thread) or when keep_mining() returns False
+        if self.num_workers == 0:
+            return self.mine_here(prefix, target, keep_mining)
+        self.start()
+        # drop what is left from earlier jobs : late ranges, and the wake-ups of cancels after they ended
+        while not self.finished.empty():
+            self.finished.get_nowait()
+        job_id = self.job.value
+        ranges = self.ranges()
+        # number of ranges of this job that have not finished
+        pending = 0
+        result = (None, None)
+        # the callbacks run on the pool's result thread once the outcome of a range is known
+        # (the ranges of an earlier job that finish late are ignored by their job id)
+        done = lambda outcome: self.finished.put((job_id, outcome))
+        try:
+            while self.job.value == job_id and keep_mining():
+                # keep every worker busy with a couple of ranges
+                while pending < self.num_workers*2:
+                    nonce_range = next(ranges, None)
+                    if nonce_range is None:
+                        break
+                    self.pool.apply_async(_search, (job_id, prefix) + nonce_range + (target,), callback=done, error_callback=done)
+                    pending += 1
+                if pending == 0:
+                    break
+                # wait for a range to finish or for mining to be cancelled, then collect every range that is done
+                finished = [self.finished.get()]
+                while not self.finished.empty():
+                    finished.append(self.finished.get_nowait())
+                for finished_job, outcome in finished:
+                    if finished_job != job_id:
+                        continue
+                    pending -= 1
+                    if isinstance(outcome, BaseException):
+                        raise outcome
+                    nonce, proof_of_work, tried = outcome
+                    self.hashes += tried
+                    if nonce is not None:
+                        result = (nonce, proof_of_work)
+                if result[0] is not None:
+                    break
+        finally:
+            # stop the workers that are still searching
+            self.cancel()
+        return result
+
+    def mine_here(self, prefix, target, keep_mining):
+        # search the ranges in the calling thread, checking for cancellation between and within them
+        job_id = self.job.value
+        stop = lambda: self.job.value != job_id
+        for start, count in self.ranges():
+            if stop() or not keep_mining():
+                break
+            nonce, proof_of_work, tried = hashing.search(prefix, start, count, target, stop)
+            self.hashes += tried
+            if nonce is not None:
+                return (nonce, proof_of_work)
+        return (None, None)
@@ -4,113 +4,542 @@
 from pprint import pprint
 from transaction import Transaction
 from user import User 
+from utxo_set import UTXOSet
+from address_index import AddressIndex
+from mempool import Mempool
+from snapshot import Snapshot
+from difficulty import DifficultyController
 import json
 import hashlib
 
+from collections import deque
+import multiprocessing
+import os
+import threading
+
+
+def find_signers(items):
+    # find the key that made each signature of a chunk of (public keys, signature) items in a worker process
+    # return (public key, signed message) for each item, or None if none of the keys made the signature
+    found = []
+    for public_keys, signature in items:
+        signer = None
+        for public_key in public_keys:
+            message = User.check_signature(public_key, signature)
+            if message is not None:
+                signer = (public_key, message)
+                break
+        found.append(signer)
+    return found
+
+
 class Network:
 
-    def __init__(self):
+    def __init__(self, store=None, snapshot=None, snapshot_interval=None, snapshot_path=None, difficulty=None):
+        # index the outputs of the verified transactions by transaction id
+        self.utxo_set = UTXOSet()
         # store transactions until they have been verified and can be added to the blockchain
-        self.unverified_transaction_pool = {}
+        self.unverified_transaction_pool = Mempool(lambda id: id in self.utxo_set)
         # store the global verified transactions
+        # (only for a chain in memory : the transactions of a stored chain stay in the store, see transaction_count)
         self.verified_transaction_pool = [] 
-        # store the minimum number of zeros for a valid proof of work
-        self.min_zeros_msb = 5
+        # store the blocks of the blockchain, which hold the verified transactions
+        # (in memory, or on disk if a ChainStore is given)
+        self.blockchain = [] if store is None else store
+        self.store = store
+        # where each verified transaction is : {transaction id : (height of its block, index in the block)}
+        # (only for a chain in memory : the transactions of a stored chain are located by the store)
+        self.transaction_locations = {}
+        # the outputs, balance and history of each public key, for wallet and explorer queries
+        self.address_index = AddressIndex()
+        # the inputs spent by the transactions in the unverified transaction pool : {input id : spending transaction id}
+        # (the inputs spent by verified transactions are tracked by the utxo set)
+        self.pending_spends = {}
+
+        # guards every change to the pools, so that the checks and updates of a change are atomic
+        self.lock = threading.RLock()
+        # wakes up the nodes and the simulation when the pools change
+        self.condition = threading.Condition(self.lock)
+        # incremented on every change to the pools
+        self.version = 0
+        # functions called with each new block added to the verified transaction pool
+        self.block_listeners = []
+        # functions called after every change to the pools (for waiters that are not threads)
+        self.change_listeners = []
+        # sets the target that the proof of work of each block must meet
+        self.difficulty = difficulty if difficulty is not None else DifficultyController()
+        # store the maximum number of transactions in a block
+        self.max_block_size = 1000
+        # snapshot the ledger state every snapshot_interval blocks, and write it to snapshot_path if it is given
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_path = snapshot_path
+        self.latest_snapshot = None
+
+        # rebuild the utxo set and the address index from the blocks already in the store,
+        # starting from the snapshot if one is given, so that only the blocks after it are replayed
+        # (without a snapshot, reopening a store decodes every block : a fast reopen needs a recent snapshot)
+        start = 0
+        if snapshot is not None:
+            if len(self.blockchain) < snapshot.height or self.blockchain[snapshot.height - 1].id() != snapshot.tip:
+                raise ValueError("snapshot is not of this blockchain")
+            self.utxo_set = snapshot.utxo_set()
+            self.address_index = AddressIndex.from_utxo_set(self.utxo_set)
+            self.latest_snapshot = snapshot
+            start = snapshot.height
+        for height in range(start, len(self.blockchain)):
+            self.index_block(self.blockchain[height], height)
+        # the blocks below this height were not replayed, so they cannot be rolled back
+        self.replayed_from = start
         
     # functions that allow users to interact with the network
     def push_transaction_utp(self, transaction):
-        # if it is not the genesis block, verify that the transaction is valid
-        if not self.network_is_empty():
-            if not transaction.is_valid(self.unverified_transaction_pool, self.verified_transaction_pool): return False
-            if self.is_double_spent(transaction): return False
-        
-        # attempt to add the transaction
-        self.unverified_transaction_pool[transaction.data['transaction']['id']] = transaction
-
-        # print("\npushed a transaction to the unverified transaction pool")
-        # print("transaction id: {}\n".format(transaction.data['transaction']['id']))
-
-        # check that the transaction was added correctly and return success or failure
-        return self.utp_contains_transaction(transaction)
-
-    def push_transaction_vtp(self, transaction):
-        print("\n...")
-        print("attempt to add a transaction to the verified transaction pool")
-        print("...\n")
-        # if it is not the genesis block, verify that the transaction is valid
-        if not self.vtp_is_empty():
-            if not transaction.is_valid(self.unverified_transaction_pool, self.verified_transaction_pool):
-                print("not valid") 
-                return False
-            if self.is_double_spent(transaction): 
-                print("double spent")
-                return False
-            # check the structure of the fields that have been updated since the object was first verified
-            if not transaction.has_valid_addl_structure(): 
-                print("structure error")
-                return False
-            # check that the previous pointer points at the last block on the chain
-            if transaction.data['transaction']['ptr_prev_trans'] != self.verified_transaction_pool[-1].data['transaction']['id']: return False
-            if not self.has_valid_proof_of_work(transaction): 
-                print("proof of work error")
-                return False
+        with self.lock:
+            # ignore transactions that are already on the blockchain
+            if transaction.id in self.utxo_set: return False
+            # if it is not the genesis block, verify that the transaction is valid
+            if not self.network_is_empty():
+                if not transaction.is_valid(self.unverified_transaction_pool, self.utxo_set): return False
+                if self.is_double_spent(transaction): return False
         
-        # remove the transaction from the unverified transaction pool
-        self.unverified_transaction_pool.pop(transaction.data['transaction']['id'])
+            # attempt to add the transaction
+            self.unverified_transaction_pool.add(transaction)
+            self.track_pending_spends(transaction)
+            self.notify()
+
+            # print("\npushed a transaction to the unverified transaction pool")
+            # print("transaction id: {}\n".format(transaction.data['transaction']['id']))
+
+            # check that the transaction was added correctly and return success or failure
+            return self.utp_contains_transaction(transaction)
+
+    def push_transactions_utp(self, transactions, chunk_size=4096, num_workers=None):
+        # add many transactions to the unverified transaction pool
+        # return a list of (transaction id, accepted) pairs
+        return list(self.ingest_transactions(transactions, chunk_size, num_workers))
+
+    def ingest_transactions(self, transactions, chunk_size=4096, num_workers=None):
+        # add transactions to the unverified transaction pool a chunk at a time, yielding (transaction id, accepted)
+        # the signatures of each chunk are checked in parallel in a process pool before the transactions are
+        # added in dependency order, and a transaction that spends an output that has not been seen yet waits
+        # until the transaction that creates it has been added
+        num_workers = num_workers or os.cpu_count() or 1
+        pool = multiprocessing.Pool(num_workers) if num_workers > 1 else None
+        # transactions waiting on an input : {missing input id : [transactions]}
+        waiting = {}
+        try:
+            chunk = []
+            for transaction in transactions:
+                chunk.append(transaction)
+                if len(chunk) == chunk_size:
+                    yield from self.ingest_chunk(chunk, waiting, pool, num_workers)
+                    chunk = []
+            yield from self.ingest_chunk(chunk, waiting, pool, num_workers)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        # the inputs of the remaining transactions never showed up
+        for transactions in waiting.values():
+            for transaction in transactions:
+                yield (transaction.id, False)
+
+    def ingest_chunk(self, chunk, waiting, pool, num_workers):
+        # find the signatures to check : the signature of each input, against the public keys in that input's output
+        batch = {transaction.id: transaction for transaction in chunk}
+        inputs_to_check = []
+        for transaction in chunk:
+            inputs = transaction.input
+            # leave malformed transactions to be rejected by the validation below
+            # (their signing message may not even be encodable)
+            if not transaction.has_valid_req_structure():
+                continue
+            for idx, signature in enumerate(transaction.signature):
+                if inputs[idx] in batch:
+                    output = batch[inputs[idx]].output
+                else:
+                    output = transaction.find_trans_output(idx, self.unverified_transaction_pool, self.utxo_set)
+                public_keys = [public_key for public_key in output if type(public_key) == str]
+                # the signer was already found if the transaction was validated before (after a rollback)
+                if len(public_keys) > 0 and transaction.recorded_signer(idx) is None:
+                    inputs_to_check.append((transaction, idx, public_keys, signature))
+
+        # find the signers in parallel, stopping at the key that made each signature, and record them
+        # on the transactions for the validation below (not in the signature cache, which a chunk would overflow)
+        items = [(public_keys, signature) for transaction, idx, public_keys, signature in inputs_to_check]
+        if pool is not None and len(items) > num_workers:
+            size = -(-len(items) // num_workers)
+            found = [signer for signers in pool.map(find_signers, [items[i:i+size] for i in range(0, len(items), size)]) for signer in signers]
+        else:
+            found = find_signers(items)
+        for (transaction, idx, public_keys, signature), signer in zip(inputs_to_check, found):
+            if signer is not None and signer[1] == transaction.own_signing_message():
+                transaction.record_signer(idx, signer[0])
+
+        # add the transactions once every input they spend is known
+        queue = deque(chunk)
+        while queue:
+            transaction = queue.popleft()
+            missing = None
+            if type(transaction.input) == list and not self.network_is_empty():
+                missing = next((input for input in transaction.input if type(input) == str
+                                and input not in self.unverified_transaction_pool and input not in self.utxo_set), None)
+            if missing is not None:
+                waiting.setdefault(missing, []).append(transaction)
+                continue
+            accepted = self.push_transaction_utp(transaction)
+            yield (transaction.id, accepted)
+            if accepted:
+                queue.extend(waiting.pop(transaction.id, []))
+
+    def push_block_vtp(self, block):
+        # add a block to the end of the blockchain and its transactions to the verified transaction pool
+        # the block is only added if the chain still ends at the block it points at (compare-and-append),
+        # so that two nodes that mined on the same tip cannot both append
+        with self.lock:
+            print("\n...")
+            print("attempt to add a block to the blockchain")
+            print("...\n")
+            # if it is not the genesis block, verify that the block is valid
+            if len(self.blockchain) > 0:
+                if not block.has_valid_structure(): 
+                    print("structure error")
+                    return False
+                if len(block.data['transactions']) > self.max_block_size:
+                    print("block too large")
+                    return False
+                # check that the previous pointer points at the last block on the chain
+                if block.data['header']['ptr_prev'] != self.blockchain[-1].id(): return False
+                # check that the block commits to the target set by the blocks before it
+                if not self.difficulty.is_valid(block.data['header'], len(self.blockchain), self.header_at):
+                    print("difficulty error")
+                    return False
+                if not self.has_valid_proof_of_work(block): 
+                    print("proof of work error")
+                    return False
+
+            # verify the transactions in order, adding each one to the utxo set so that
+            # the transactions later in the block can spend the earlier ones
+            added = []
+            for transaction in block.data['transactions']:
+                if len(self.blockchain) > 0:
+                    error = None
+                    if transaction.id in self.utxo_set:
+                        error = "already on the blockchain"
+                    elif not transaction.is_valid({}, self.utxo_set):
+                        error = "not valid"
+                    elif self.find_double_spend(transaction, include_pending=False) is not None:
+                        error = "double spent"
+                    if error is not None:
+                        print(error)
+                        for trans in reversed(added):
+                            self.utxo_set.remove(trans)
+                        return False
+                self.utxo_set.add(transaction)
+                added.append(transaction)
+
+            # add the block to the blockchain
+            self.blockchain.append(block)
+            for index, transaction in enumerate(block.data['transactions']):
+                # move the transaction from the unverified transaction pool to the verified transaction pool
+                self.remove_transaction_utp(transaction)
+                if self.store is None:
+                    self.verified_transaction_pool.append(transaction)
+                    self.transaction_locations[transaction.id] = (len(self.blockchain) - 1, index)
+                self.address_index.add(transaction, len(self.blockchain) - 1, self.utxo_set)
+                # drop the unverified transactions that spend the same inputs
+                self.evict_conflicts(transaction)
+                # the transactions that spend this one may now be ready to mine
+                self.unverified_transaction_pool.confirm(transaction.id)
+            if self.snapshot_interval is not None and len(self.blockchain) % self.snapshot_interval == 0:
+                self.take_snapshot()
+            self.notify_new_block(block)
+
+            print("\npushed a block to the blockchain")
+            print("block id: {}".format(block.id()))
+            print("transactions: {}\n".format(len(block.data['transactions'])))
+
+            # add a transaction to reallocate excess funds
+            # self.reallocate_excess_funds(transaction)
+
+            return True
+
+    def index_block(self, block, height):
+        # add the transactions of a block that is already on the blockchain to the verified indexes
+        # the block was checked before it was stored, so it is not verified again
+        for index, transaction in enumerate(block.data['transactions']):
+            self.utxo_set.add(transaction)
+            if self.store is None:
+                self.verified_transaction_pool.append(transaction)
+                self.transaction_locations[transaction.id] = (height, index)
+            self.address_index.add(transaction, height, self.utxo_set)
+
+    def take_snapshot(self):
+        # snapshot the ledger state at the current tip
+        with self.lock:
+            self.latest_snapshot = Snapshot.take(self)
+            if self.snapshot_path is not None:
+                self.latest_snapshot.save(self.snapshot_path)
+            return self.latest_snapshot
+
+    def get_block(self, height):
+        with self.lock:
+            return self.blockchain[height]
+
+    def blocks_since(self, height):
+        # get the blocks added to the chain after the first height blocks
+        with self.lock:
+            return self.blockchain[height:]
 
-        # add the transsaction to the verified transaction pool
-        self.verified_transaction_pool.append(transaction)
+    def get_header(self, height):
+        # get a copy of the header of the block at height, or None if the chain is not that long
+        with self.lock:
+            if height >= len(self.blockchain):
+                return None
+            return dict(self.blockchain[height].data['header'])
 
-        print("\npushed a transaction to the verified transaction pool")
-        print("transaction id: {}\n".format(transaction.data['transaction']['id']))
+    def headers_since(self, height):
+        # get copies of the headers of the blocks added to the chain after the first height blocks (for light nodes)
+        with self.lock:
+            return [dict(block.data['header']) for block in self.blockchain[height:]]
 
-        # check that the transaction was added correctly
-        if not self.vtp_contains_transaction(transaction): return False
+    def locate_transaction(self, transaction_id):
+        # get (height of the block holding a verified transaction, index in the block), or None
+        with self.lock:
+            location = self.transaction_locations.get(transaction_id)
+            if location is None and self.store is not None:
+                # transactions from before the snapshot the network started from are only indexed by the store
+                location = self.store.locate(transaction_id)
+            return location
 
-        # add a transaction to reallocate excess funds
-        # self.reallocate_excess_funds(transaction)
+    def get_transaction(self, transaction_id):
+        # get a transaction from either pool by its id, or None
+        with self.lock:
+            transaction = self.unverified_transaction_pool.get(transaction_id)
+            if transaction is not None:
+                return transaction
+            location = self.locate_transaction(transaction_id)
+            if location is None:
+                return None
+            return self.blockchain[location[0]].data['transactions'][location[1]]
 
-        return True
+    def get_merkle_proof(self, transaction_id):
+        # get (id of the block holding a verified transaction, merkle proof of its inclusion)
+        # return None if the transaction is not on the blockchain
+        with self.lock:
+            location = self.locate_transaction(transaction_id)
+            if location is None:
+                return None
+            block = self.blockchain[location[0]]
+            return (block.id(), block.merkle_proof(location[1]))
+
+    # functions that answer wallet and explorer queries about a public key
+    def get_balance(self, public_key):
+        with self.lock:
+            return self.address_index.balance(public_key)
+
+    def get_unspent_outputs(self, public_key, offset=0, limit=100):
+        # a page of the verified outputs a public key can spend (see AddressIndex.unspent_outputs)
+        with self.lock:
+            return self.address_index.unspent_outputs(public_key, offset, limit)
+
+    def get_address_history(self, public_key, offset=0, limit=100, newest_first=True):
+        # a page of the verified transactions that changed the balance of a public key (see AddressIndex.transactions)
+        with self.lock:
+            return self.address_index.transactions(public_key, offset, limit, newest_first)
+
+    def chain_length(self):
+        return len(self.blockchain)
+
+    def transaction_count(self):
+        # number of transactions on the blockchain
+        return self.store.transaction_count if self.store is not None else len(self.verified_transaction_pool)
+
+    def header_at(self, height):
+        return self.blockchain[height].data['header']
+
+    def next_target(self):
+        # the target of the next block on the chain
+        with self.lock:
+            return self.difficulty.next_target(len(self.blockchain), self.header_at)
+
+    def claim_transactions(self, claimant, count):
+        # take up to count ready transactions with the highest priority that no other node is working on
+        with self.lock:
+            transactions = []
+            while len(transactions) < count:
+                transaction = self.unverified_transaction_pool.claim(claimant)
+                if transaction is None:
+                    break
+                transactions.append(transaction)
+            return transactions
+
+    def release_transactions(self, transactions, claimant):
+        with self.lock:
+            released = False
+            for transaction in transactions:
+                self.unverified_transaction_pool.release(transaction.id, claimant)
+                released = released or self.unverified_transaction_pool.is_ready(transaction.id)
+            # wake up the nodes that are waiting for work
+            if released:
+                self.notify()
+
+    def rollback_block_vtp(self):
+        # remove the last block from the blockchain (when its branch loses a fork) and return
+        # its transactions to the unverified transaction pool so that they can be mined again
+        with self.lock:
+            if len(self.blockchain) <= 1: return None
+            # the blocks covered by the snapshot the network started from are not in its indexes :
+            # refuse before the store is truncated
+            if len(self.blockchain) <= self.replayed_from: return None
+            block = self.blockchain.pop()
+            for transaction in reversed(block.data['transactions']):
+                if self.store is None:
+                    self.verified_transaction_pool.pop()
+                    self.transaction_locations.pop(transaction.id, None)
+                self.address_index.remove(transaction)
+                self.utxo_set.remove(transaction)
+                self.unverified_transaction_pool.unconfirm(transaction.id)
+            for transaction in block.data['transactions']:
+                self.unverified_transaction_pool.add(transaction)
+                self.track_pending_spends(transaction)
+            # a snapshot of a block that is no longer on the chain cannot be trusted
+            if self.latest_snapshot is not None and self.latest_snapshot.height > len(self.blockchain):
+                self.latest_snapshot = None
+            self.notify()
+            return block
+
+    # functions that notify the nodes of changes to the network
+    def notify(self):
+        # wake up everything waiting on the network
+        with self.condition:
+            self.version += 1
+            self.condition.notify_all()
+            for listener in self.change_listeners:
+                listener()
+
+    def notify_new_block(self, block):
+        self.notify()
+        for listener in self.block_listeners:
+            listener(block)
+
+    def subscribe_changes(self, listener):
+        self.change_listeners.append(listener)
+
+    def subscribe_new_blocks(self, listener):
+        self.block_listeners.append(listener)
+
+    def wait_for_transactions(self, stop=lambda: False, timeout=None):
+        # wait until the unverified transaction pool has transactions that are ready to mine (or stop() is true)
+        with self.condition:
+            return self.condition.wait_for(lambda: self.unverified_transaction_pool.has_ready() or stop(), timeout)
+
+    def wait_for_change(self, version, stop=lambda: False, timeout=None):
+        # wait until the pools change from the given version (or stop() is true)
+        with self.condition:
+            return self.condition.wait_for(lambda: self.version != version or stop(), timeout)
+
+    def wait_for_length(self, length, timeout=None):
+        # wait until the verified transaction pool has at least the given number of transactions
+        with self.condition:
+            return self.condition.wait_for(lambda: self.transaction_count() >= length, timeout)
 
     # functions that regulate the unverified_transaction_pool
     def utp_contains_transaction(self, transaction):
-        return self.unverified_transaction_pool.get(transaction.data['transaction']['id']) != None
+        return transaction.id in self.unverified_transaction_pool
 
     def vtp_contains_transaction(self, transaction):
-        return self.unverified_transaction_pool.get(transaction.data['transaction']['id']) != None
+        return transaction.id in self.utxo_set
+
+    def contains_transaction(self, transaction_id):
+        # whether a transaction is in either pool, by id
+        return transaction_id in self.unverified_transaction_pool or transaction_id in self.utxo_set
+
+    def remove_transaction_utp(self, transaction, with_dependants=False):
+        # remove a transaction from the unverified transaction pool
+        # if with_dependants is True, also remove the transactions that can no longer be valid without it
+        with self.lock:
+            removed = self.unverified_transaction_pool.pop(transaction.id, None)
+            if removed is not None:
+                self.untrack_pending_spends(removed)
+                if with_dependants:
+                    for id in self.unverified_transaction_pool.dependants(transaction.id):
+                        dependant = self.unverified_transaction_pool.get(id)
+                        if dependant is not None:
+                            self.remove_transaction_utp(dependant, True)
+                self.notify()
+            return removed
+
+    def track_pending_spends(self, transaction):
+        # record the inputs spent by a transaction in the unverified transaction pool
+        # the first transaction seen to spend an input keeps it
+        for input in transaction.input:
+            if input != self.utxo_set.genesis_id:
+                self.pending_spends.setdefault(input, transaction.id)
+
+    def untrack_pending_spends(self, transaction):
+        for input in transaction.input:
+            if self.pending_spends.get(input) == transaction.id:
+                self.pending_spends.pop(input)
+
+    def find_double_spend(self, transaction, include_pending=True):
+        # return the id of another transaction (verified, or unverified if include_pending is True)
+        # that spends one of the same inputs
+        # return None if there is no conflict
+        for input in transaction.input:
+            # ignore transactions that refer to the genesis block
+            if input == self.utxo_set.genesis_id:
+                continue
+            spenders = (self.utxo_set.spent_by(input), self.pending_spends.get(input)) if include_pending else (self.utxo_set.spent_by(input),)
+            for spender in spenders:
+                if spender is not None and spender != transaction.id:
+                    return spender
+        return None
+
+    def evict_conflicts(self, transaction):
+        # remove the unverified transactions that spend an input of a newly verified transaction
+        for input in transaction.input:
+            spender = self.pending_spends.get(input)
+            if spender is not None and spender != transaction.id:
+                conflict = self.unverified_transaction_pool.get(spender)
+                if conflict is not None:
+                    self.remove_transaction_utp(conflict, True)
 
     def is_double_spent(self, transaction):
-        # check for double spending in the verified transaction pool
-        # otherwise, check each transaction for repeated inputs
-        for trans in self.verified_transaction_pool[1:]:
-            for input in transaction.data['transaction']['input']:
-                # ignore transactions that refer to the genesis block
-                if input != self.verified_transaction_pool[0].data['transaction']['id']:
-                    for id in trans.data["transaction"]['input']:
-                        if input == id:
-                            return True
-        return False
+        return self.find_double_spend(transaction) is not None
 
     def handle_double_spent(self, transaction):
         # remove double spent transactions from the unverified transaction pool and report an error
-        if self.is_double_spent(transaction):
-            # remove the transaction
-            if self.utp_contains_transaction(transaction):
-                self.unverified_transaction_pool.pop(transaction.data['transaction']['id'])
-                # report an error
-                print("Error: double spend detected. Removing malicious transaction from the unverified transaction pool.")
+        with self.lock:
+            conflict = self.find_double_spend(transaction)
+            if conflict is not None:
+                # remove the transaction
+                if self.remove_transaction_utp(transaction, True) is not None:
+                    # report an error
+                    print("Error: double spend detected. Removing malicious transaction from the unverified transaction pool.")
+                    print("Conflicts with transaction: {}".format(conflict))
+                    print("Removed item:")
+                    transaction.display()
+                    return True
+            return False
+
+    def handle_invalid(self, transaction):
+        # remove a transaction that is ready to mine but not valid from the unverified transaction pool
+        # once every input is on the chain, the transaction can not become valid later
+        with self.lock:
+            if not self.unverified_transaction_pool.is_ready(transaction.id):
+                return False
+            if transaction.is_valid(self.unverified_transaction_pool, self.utxo_set):
+                return False
+            if self.remove_transaction_utp(transaction, True) is not None:
+                print("Error: invalid transaction. Removing it from the unverified transaction pool.")
                 print("Removed item:")
                 transaction.display()
                 return True
-        return False
+            return False
 
-    def has_valid_proof_of_work(self, transaction):
-        # verify that the proof of work for the transaction is correct
-        proof_of_work = hashlib.sha256((str(transaction)+str(transaction.data['transaction']['nonce'])).encode()).hexdigest()
-        # calculate the upper bound on a valid proof of work
-        upper_bound = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF >> self.min_zeros_msb*4
-        # check that there are the correct number of leading zeros
-        return int(proof_of_work, 16) <= upper_bound
+    def has_valid_proof_of_work(self, block):
+        # verify that the proof of work for the block meets the target in its header
+        return block.has_valid_proof_of_work()
 
     def display_unverified_transaction_pool(self):
         print("\nUnverified Transaction Pool")
@@ -120,8 +549,8 @@ class Network:
 
     def display_verified_transaction_pool(self):
         print("\nVerified Transaction Pool")
-        for transaction in self.verified_transaction_pool:
-            transaction.display()
+        for block in self.blockchain:
+            block.display()
 
 
     def display(self):
@@ -129,10 +558,10 @@ class Network:
         self.display_verified_transaction_pool()
 
     def network_is_empty(self):
-        return len(self.unverified_transaction_pool) == 0 and len(self.verified_transaction_pool) == 0
+        return len(self.unverified_transaction_pool) == 0 and self.transaction_count() == 0
 
     def vtp_is_empty(self):
-        return len(self.verified_transaction_pool) == 0
+        return self.transaction_count() == 0
 
 
     # def reallocate_excess_funds(self, transaction):
@@ -2,6 +2,10 @@
 # Defines a node that can verify unverified transactions.
 
 from transaction import Transaction
+from block import Block
+from miner import Miner
+from block_tree import BlockTree
+import difficulty
 
 
 from pprint import pprint
@@ -16,49 +20,94 @@ import os
 class Node:
     EMPTY = 0
 
-    def __init__(self, network):
+    def __init__(self, network, miner=None, block_size=100, snapshot=None):
         self.network = network
         self.simulation_finished = False
+        # maximum number of transactions this node puts in a block
+        self.block_size = min(block_size, network.max_block_size)
+        # searches the nonce space on a pool of worker processes
+        self.miner = miner if miner is not None else Miner()
 
+        # the best chain in the block tree
         self.local_chain = []
+        # every block this node has seen, including the ones on losing branches
+        # (the best chain is the one with the most work, as set by the target of each block)
+        self.block_tree = BlockTree(difficulty.block_work)
+        # number of blocks of the network's blockchain that have been synced
+        self.sync_height = 0
+
+        # start from a trusted snapshot instead of validating the chain from the genesis block
+        if snapshot is not None:
+            self.bootstrap(snapshot)
+
+        # stop mining when another node adds a block
+        self.network.subscribe_new_blocks(self.on_new_block)
     
     def run(self):
         print("created a node")
         while not self.simulation_finished:
             # update the local chain
             self.update_local_chain()
-            # if the unverified transaction pool is empty, wait
-            while len(self.network.unverified_transaction_pool) == 0 and not self.simulation_finished:
-                time.sleep(0.001)
+            # if no transaction is ready to be mined, wait
+            self.network.wait_for_transactions(lambda: self.simulation_finished)
             if self.simulation_finished:
                 break
-            # select a new transaction at random to verify
-            transaction = random.choice(list(self.network.unverified_transaction_pool.values()))
-            # print("node is working on transaction {}...\n".format(transaction.data['transaction']['id'][:20]))
-            # verify it
-            if self.network.is_double_spent(transaction): 
-                self.network.handle_double_spent(transaction)
-            elif transaction.is_valid(self.network.unverified_transaction_pool, self.network.verified_transaction_pool):
-                # add hash pointer to the last transaction of the node's chain
-                transaction.data['transaction']['ptr_prev_trans'] = self.local_chain[-1].data['transaction']['id']
-                # then, verify the transaction by running  proof of work
-                nonce, proof_of_work = self.mine(transaction)
-                if nonce is not None:
-                    # add the nonce and proof of work to the transaction
-                    transaction.data['transaction']['nonce'] = nonce
-                    transaction.data['transaction']['proof_of_work'] = proof_of_work
-                    # remove it from the unverified transaction pool and add it to the blockchain                    
-                    self.network.push_transaction_vtp(transaction)
-                    time.sleep(5)
+            # claim the transactions with the highest priority that no other node is working on
+            version = self.network.version
+            transactions = self.network.claim_transactions(self, self.block_size)
+            if len(transactions) == 0:
+                # all of the ready transactions are claimed by other nodes
+                self.network.wait_for_change(version, lambda: self.simulation_finished)
+                continue
+            # print("node is working on {} transactions...\n".format(len(transactions)))
+            try:
+                # verify them
+                block_transactions = self.verify_transactions(transactions)
+                if len(block_transactions) > 0:
+                    # add hash pointer to the last block of the node's chain, and the target the chain sets for it
+                    block = Block(block_transactions, self.local_chain[-1].id(), self.network.next_target())
+                    # then, verify the block by running proof of work
+                    nonce, proof_of_work = self.mine(block)
+                    if nonce is not None:
+                        # add the nonce and proof of work to the block and add it to the blockchain,
+                        # unless another node got there first
+                        block.seal(nonce, proof_of_work)
+                        self.network.push_block_vtp(block)
+            finally:
+                # let other nodes work on the transactions that are still in the pool
+                self.network.release_transactions(transactions, self)
+        self.miner.close()
         print("node exiting")
         print("--------------------------------------------------------------------------------------------")
         self.update_local_chain()
         self.display_node_list()
         print("--------------------------------------------------------------------------------------------")
     
+    def verify_transactions(self, transactions):
+        # return the claimed transactions that can go in a block, dropping the invalid and double spent ones from the pool
+        block_transactions = []
+        for transaction in transactions:
+            if self.network.is_double_spent(transaction): 
+                self.network.handle_double_spent(transaction)
+            elif transaction.is_valid(self.network.unverified_transaction_pool, self.network.utxo_set):
+                block_transactions.append(transaction)
+            else:
+                self.network.handle_invalid(transaction)
+        return block_transactions
+
+    def stop(self):
+        # signal the node to finish, interrupting any mining or waiting
+        self.simulation_finished = True
+        self.miner.cancel()
+        self.network.notify()
+
+    def on_new_block(self, block):
+        # stop mining as soon as another block is added to the chain
+        self.miner.cancel()
+
     def display_node_list(self): 
-        for t in self.local_chain:
-            t.display()
+        for block in self.local_chain:
+            block.display()
     
     def input_exists(self, transaction):
         for trans in self.network.verified_trans_pool:
@@ -67,121 +116,94 @@ class Node:
         return False
     
     def detect_forks(self):
-        # Find any repeated transactions
-        dups = {}
-        # check all of the blocks after the genesis for forks
-        for trans in self.local_chain[1:]:
-            # Store the pointers to previous transactions in the dups dict
-            # if it tries to add one that already exists, it has found a fork
-            if dups[trans.data['transaction']['ptr_prev_trans']] == "found":
-                return True 
-            dups[trans.data['transaction']['ptr_prev_trans']] = "found"
-        return False  
+        # check whether any block has more than one block pointing at it
+        return self.block_tree.has_forks()
     
     def resolve_forks(self):
-        # resolve the forks
-        fork_keys = []
-        dups = {}
-        for trans in self.local_chain[1:]:
-            if trans.data['transaction']['ptr_prev_trans'] in dups.keys():
-                # store all of the transactions that point at the previous transaction at its key
-                dups[trans.data['transaction']['ptr_prev_trans']].append(trans) 
-                # TODO this might need some fixing?
-                fork_keys.append(trans.data['transaction']['ptr_prev_trans'])
-            dups[trans.data['transaction']['ptr_prev_trans']] = [trans]
-
-        # resolve forks starting with the one fathest down the chain
-        if fork_keys is not None:
-            fork_keys = set(sorted(fork_keys, reverse=True)) # set removes duplicates
-        # keep track of the branches that need to be removed from the local chain
-        shorter_branches = []
-        for fork in fork_keys: 
-            branch_heads = dups[fork]
-            longest_branch = []
-            # shorter_branches = []
-            # traverse each branch to find its length
-            for head in branch_heads:
-                this_branch = [head]
-                transaction = head
-                # while there is a trans that points at this one, add it to this branch
-                while dups[transaction.data['transaction']['id']]:
-                    this_branch.append(dups[transaction.data['transaction']['id']])
-                    transaction = dups[transaction.data['transaction']['id']]
-                # update the longest branch and shorter branches
-                if len(this_branch) > len(longest_branch):
-                    shorter_branches.append(longest_branch)
-                    longest_branch = this_branch
-                else:
-                    shorter_branches.append(this_branch)
-
-        # remove the branches that are not the longest branch from the local chain
-        had_fork = False
-        for branch in shorter_branches:
-            for i, transaction in enumerate(self.local_chain):
-                if transaction in branch:
-                    # remove from verified transaction pool
-                    removed_trans = self.local_chain.pop(i)
-                    # add to unverified transaction pool
-                    self.network.push_transaction_utp(removed_trans)
-                    had_fork = True
-        
-        if had_fork:
+        # move the local chain onto the best branch of the block tree
+        tip = self.local_chain[-1].id() if len(self.local_chain) > 0 else None
+        if tip == self.block_tree.best_tip:
+            return
+        removed, added = self.block_tree.path_diff(tip, self.block_tree.best_tip)
+        # remove the blocks of the losing branch from the end of the local chain
+        for block in removed:
+            self.local_chain.pop()
+        for block in added:
+            self.local_chain.append(block)
+
+        # the transactions of the losing branch were returned to the unverified transaction pool
+        # when the network rolled its blocks back (see Network.rollback_block_vtp)
+        if len(removed) > 0:
             print("resolved a fork in local chain\n" + self.display())
     
+    def bootstrap(self, snapshot):
+        # take the block the snapshot was taken at as the root of the local chain, so that
+        # update_local_chain only validates the blocks added after it
+        block = self.network.get_block(snapshot.height - 1)
+        if block.id() != snapshot.tip:
+            raise ValueError("snapshot is not of the network's blockchain")
+        self.block_tree = BlockTree(difficulty.block_work)
+        self.block_tree.add(block)
+        self.local_chain = [block]
+        self.sync_height = snapshot.height
+
     def update_local_chain(self):
         # update local chain to match the blockchain in the network
-        if len(self.local_chain) < len(self.network.verified_transaction_pool):
+        # the blockchain may have been rolled back since the last sync
+        self.sync_height = min(self.sync_height, self.network.chain_length())
+        # only fetch the blocks that were added since the last sync
+        new_blocks = self.network.blocks_since(self.sync_height)
+        # the blocks below the last sync may have been replaced by another branch since then :
+        # go back until the new blocks join the block tree
+        while len(new_blocks) > 0 and self.sync_height > 0 and len(self.block_tree) > 0 and new_blocks[0].data['header']['ptr_prev'] not in self.block_tree:
+            self.sync_height -= 1
+            new_blocks = self.network.blocks_since(self.sync_height)
+        if len(new_blocks) == 0:
+            return
+        for block in new_blocks:
+            if block.id() in self.block_tree:
+                continue
             # handle the genesis block
-            if len(self.local_chain) == 0:
-                self.local_chain.append(self.network.verified_transaction_pool[0])
-            # find blocks that are not in the local chain
-            for trans in self.network.verified_transaction_pool:
-                if trans not in self.local_chain:
-                    # verify the transaction is valid
-                    if not trans.is_valid(self.network.unverified_transaction_pool, self.network.verified_transaction_pool):
-                        raise ValueError("invalid transaction")
-                    # verify the proof of work
-                    if not self.has_valid_proof_of_work(trans):
-                        raise ValueError("invalid proof of work")
-                    # verify hash pointer to previous transaction
-                    if trans.data['transaction']['ptr_prev_trans'] not in [t.data['transaction']['id'] for t in self.local_chain]:
-                        raise ValueError("invalid hash")
-
-                    self.local_chain.append(trans)
-                    #  detect and handle forks in local chain
-                    self.resolve_forks()
+            if len(self.block_tree) == 0:
+                self.block_tree.add(block)
+                continue
+            # verify the structure of the block and its merkle root
+            if not block.has_valid_structure():
+                raise ValueError("invalid block")
+            # verify the transactions are valid
+            for trans in block.data['transactions']:
+                if not trans.is_valid(self.network.unverified_transaction_pool, self.network.utxo_set):
+                    raise ValueError("invalid transaction")
+            # verify the proof of work
+            if not self.has_valid_proof_of_work(block):
+                raise ValueError("invalid proof of work")
+            # verify hash pointer to previous block
+            if block.data['header']['ptr_prev'] not in self.block_tree:
+                raise ValueError("invalid hash")
+
+            self.block_tree.add(block, block.data['header']['ptr_prev'])
+        self.sync_height += len(new_blocks)
+
+        # detect and handle forks in local chain once for the whole batch
+        self.resolve_forks()
 
         # print("updated node's local chain" + self.display())
 
-    def mine(self, transaction):
-        # return false if another miner has found the solution
-        # return true if this miner has found the soution
-        trans = str(transaction)
-        proof_of_work = 0
+    def mine(self, block):
+        # return (None, None) if another miner has found the solution
+        # return the nonce and proof of work if this miner has found the soution
+        header = block.serialize_header()
         # while no more blocks added to the chain:
-        while len(self.local_chain) == len(self.network.verified_transaction_pool) and not self.simulation_finished:
-            # generate a random nonce
-            nonce = random.randint(0, 4294967294)  # to 2^32-1
-            # get the proof of work
-            proof_of_work = hashlib.sha256((trans+str(nonce)).encode()).hexdigest()
-            # calculate the upper bound on a valid proof of work
-            upper_bound = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF >> self.network.min_zeros_msb*4
-            # check that there are the correct number of leading zeros
-            if int(proof_of_work, 16) <= upper_bound:
-                return (nonce, proof_of_work)
-        return (None, None)
-
-    def has_valid_proof_of_work(self, transaction):
-        # verify that the proof of work for the transaction is correct
-        proof_of_work = hashlib.sha256((str(transaction)+str(transaction.data['transaction']['nonce'])).encode()).hexdigest()
-        # calculate the upper bound on a valid proof of work
-        upper_bound = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF >> self.network.min_zeros_msb*4
-        # check that there are the correct number of leading zeros
-        return int(proof_of_work, 16) <= upper_bound
+        keep_mining = lambda: self.sync_height == self.network.chain_length() and not self.simulation_finished
+        return self.miner.mine(header, block.target(), keep_mining)
+
+    def has_valid_proof_of_work(self, block):
+        # verify that the proof of work for the block meets the target in its header
+        return block.has_valid_proof_of_work()
 
     def display(self):
         string = '\n'
-        for trans in self.local_chain:
-            string += '\t'+trans.data['transaction']['id'][:10]+'...\n' 
+        for block in self.local_chain:
+            string += '\t'+block.id()[:10]+'...\n' 
         string += '\n'
         return string
\ No newline at end of file
@@ -0,0 +1,82 @@
+# Description:
+# Defines the canonical byte encoding used to hash and sign transactions. Every value is
+# tagged with its type and every string, list and dict is prefixed with its length, and
+# dict keys are sorted, so the same data always gives the same bytes in any process.
+
+import struct
+
+_LENGTH = struct.Struct('>I')
+_INT = struct.Struct('>q')
+
+# the largest int that can be encoded (ints are 8 signed bytes)
+MAX_INT = 2**63 - 1
+
+
+def encode(value):
+    out = bytearray()
+    _encode(value, out)
+    return bytes(out)
+
+
+def _encode(value, out):
+    if value is None:
+        out += b'N'
+    elif type(value) == bool:
+        out += b'T' if value else b'F'
+    elif type(value) == int:
+        out += b'I' + _INT.pack(value)
+    elif type(value) == str:
+        value = value.encode('utf-8')
+        out += b'S' + _LENGTH.pack(len(value)) + value
+    elif type(value) in (bytes, bytearray):
+        out += b'B' + _LENGTH.pack(len(value)) + value
+    elif type(value) in (list, tuple):
+        out += b'L' + _LENGTH.pack(len(value))
+        for item in value:
+            _encode(item, out)
+    elif type(value) == dict:
+        out += b'D' + _LENGTH.pack(len(value))
+        for key in sorted(value):
+            _encode(key, out)
+            _encode(value[key], out)
+    else:
+        raise TypeError("cannot encode {}".format(type(value).__name__))
+
+
+def decode(data):
+    value, offset = _decode(memoryview(data), 0)
+    if offset != len(data):
+        raise ValueError("trailing bytes after encoded value")
+    return value
+
+
+def _decode(data, offset):
+    tag = bytes(data[offset:offset+1])
+    offset += 1
+    if tag == b'N':
+        return None, offset
+    if tag == b'T':
+        return True, offset
+    if tag == b'F':
+        return False, offset
+    if tag == b'I':
+        return _INT.unpack_from(data, offset)[0], offset + _INT.size
+    if tag in (b'S', b'B', b'L', b'D'):
+        length = _LENGTH.unpack_from(data, offset)[0]
+        offset += _LENGTH.size
+        if tag == b'S':
+            return str(data[offset:offset+length], 'utf-8'), offset + length
+        if tag == b'B':
+            return bytes(data[offset:offset+length]), offset + length
+        if tag == b'L':
+            items = []
+            for _ in range(length):
+                item, offset = _decode(data, offset)
+                items.append(item)
+            return items, offset
+        items = {}
+        for _ in range(length):
+            key, offset = _decode(data, offset)
+            items[key], offset = _decode(data, offset)
+        return items, offset
+    raise ValueError("unknown tag {!r} at offset {}".format(tag, offset - 1))
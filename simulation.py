@@ -2,13 +2,15 @@
 from pprint import pprint
 
 from node import Node
+from miner import Miner
 import threading
 import time
 import transaction_file
 from transaction import Transaction
-import json
+from block import Block
 from network import Network
 import random 
+import os
 
 # unverified_trans_pool = {}
 # verified_transaction_pool = []
@@ -33,8 +35,7 @@ def main():
     nodes, thread_nodes = create_nodes(network, num_nodes=10)
 
     # wait for the nodes to add all of the transactions to the blockchain
-    while len(network.verified_transaction_pool) != expected_blockchain_length:
-        time.sleep(0.01)
+    network.wait_for_length(expected_blockchain_length)
 
     # kill the nodes
     kill_nodes(nodes, thread_nodes)
@@ -46,40 +47,28 @@ def main():
 def process_transaction_file(network):
     transaction_file.create()
 
-    # read the transaction file
-    with open('genesis_transaction_file.json', "r") as f:
-        trans_file = json.loads(f.read())
-    pprint(trans_file)
-    
-    # add each transaction from the transaction file to the network
-    for i, t in enumerate(trans_file['transactions']):
-        # create a transaction object
-        trans = Transaction(
-            id=t['NUMBER'],
-            # input=list(map(lambda number: network.unverified_transaction_pool[str(number)].data['transaction']['output'], t['INPUT'])), 
-            input = t['INPUT'],
-            output=t['OUTPUT'], 
-            signature=t['SIGNATURE'], 
-            #  value_if_true if condition else value_if_false
-            type=t['TYPE'])
-        # add the transaction the unverified transaction pool
-        if network.push_transaction_utp(trans) is False:
-            print("Transaction {} of the transaction file cound not be added.\n".format(i))
-            # exit()
-        # directly add the genesis block
-        if i == 0:
-            network.push_transaction_vtp(trans)
-  
-        # sleep between 0 to 2 seconds between transactions
-        # time.sleep(random.random(0, 2+1))
+    # read the transaction file a transaction at a time
+    transactions = transaction_file.read_transactions(transaction_file.GENESIS_FILE)
+
+    # directly add the genesis block
+    genesis = Block([next(transactions)])
+    genesis.seal(0)
+    network.push_block_vtp(genesis)
+
+    # stream the rest of the transactions to the unverified transaction pool, checking their signatures in parallel
+    for id, accepted in network.ingest_transactions(transactions):
+        if not accepted:
+            print("Transaction {} of the transaction file cound not be added.\n".format(id))
 
 def create_nodes(network, num_nodes):
     # creating nodes and thread them to start at the same time
     nodes = []
     thread_nodes = []
+    # share the cores of the machine between the miners of the nodes
+    num_workers = max(1, (os.cpu_count() or 1) // num_nodes)
     for i in range(num_nodes):
         # add a new node using threading
-        noder = Node(network)
+        noder = Node(network, Miner(num_workers))
         n = threading.Thread(target=noder.run)
         n.start()
         # add this node to the nodes array
@@ -91,7 +80,7 @@ def kill_nodes(nodes, thread_nodes):
     # signal to the nodes that the simulation has finished
     for node in range(len(nodes)):
         print("The thread "+str(node))
-        nodes[node].simulation_finished = True
+        nodes[node].stop()
         thread_nodes[node].join()
 
     # join the nodes together
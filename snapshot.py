@@ -0,0 +1,81 @@
+# Description:
+# Defines a snapshot of the ledger state derived from the blockchain (the outputs of the
+# verified transactions, the inputs they spent, and the tip the state was taken at), with a
+# hash commitment over its canonical encoding. A node that trusts a commitment can start
+# from the snapshot and only validate the blocks added after it, instead of replaying the
+# chain from the genesis block.
+
+from utxo_set import UTXOSet
+import serialization
+
+import hashlib
+import os
+
+
+class Snapshot:
+
+    def __init__(self, height, tip, outputs, spent, genesis_id):
+        # number of blocks the state covers, and the id of the last of them
+        self.height = height
+        self.tip = tip
+        # the state of the utxo set (see UTXOSet)
+        self.outputs = outputs
+        self.spent = spent
+        self.genesis_id = genesis_id
+        self._commitment = None
+
+    def take(network):
+        # snapshot the ledger state of a network at its current tip
+        with network.lock:
+            return Snapshot(
+                network.chain_length(),
+                network.blockchain[-1].id(),
+                dict(network.utxo_set.outputs),
+                dict(network.utxo_set.spent),
+                network.utxo_set.genesis_id)
+
+    def state(self):
+        return {
+            'height': self.height,
+            'tip': self.tip,
+            'outputs': self.outputs,
+            'spent': self.spent,
+            'genesis_id': self.genesis_id
+        }
+
+    def commitment(self):
+        # hash of the canonical encoding of the state
+        if self._commitment is None:
+            self._commitment = hashlib.sha256(serialization.encode(self.state())).hexdigest()
+        return self._commitment
+
+    def utxo_set(self):
+        # build a utxo set holding the snapshot's state
+        utxo_set = UTXOSet()
+        utxo_set.outputs = dict(self.outputs)
+        utxo_set.spent = dict(self.spent)
+        utxo_set.genesis_id = self.genesis_id
+        return utxo_set
+
+    # functions that write snapshots to disk and read them back
+    def save(self, path):
+        # write the snapshot to a temporary file and rename it, so a reader never sees half a snapshot
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(serialization.encode({'state': self.state(), 'commitment': self.commitment()}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    def load(path, trusted_commitment=None):
+        # read a snapshot and check it against its commitment (and the trusted commitment, if given)
+        # raise ValueError if the snapshot does not match
+        with open(path, 'rb') as f:
+            data = serialization.decode(f.read())
+        state = data['state']
+        snapshot = Snapshot(state['height'], state['tip'], state['outputs'], state['spent'], state['genesis_id'])
+        if snapshot.commitment() != data['commitment']:
+            raise ValueError("snapshot does not match its commitment")
+        if trusted_commitment is not None and snapshot.commitment() != trusted_commitment:
+            raise ValueError("snapshot does not match the trusted commitment")
+        return snapshot
@@ -0,0 +1,44 @@
+# Description:
+# Tests how a peer handles the transactions gossiped to it (see Peer in transport.py).
+
+from block import Block
+from transaction import Transaction
+from transport import Peer
+import benchmark
+
+
+def start_peer(count):
+    # a peer on a chain holding only the genesis block, and count transactions to send it
+    transactions = benchmark.workload(count)
+    genesis = Block([next(transactions)])
+    genesis.seal(0)
+    with benchmark.quiet():
+        peer = Peer(0, [], genesis.serialize())
+    return peer, list(transactions)
+
+
+def test_forged_transaction_does_not_hide_the_genuine_one():
+    peer, transactions = start_peer(2)
+    genuine = transactions[0]
+    # a copy carrying the genuine id, but paying the whole amount to someone else
+    key = next(iter(genuine.output))
+    forged = Transaction(genuine.id, genuine.input, {key + 'x': genuine.output[key]}, genuine.signature, genuine.type)
+    with benchmark.quiet():
+        peer.receive_transaction(forged)
+        assert genuine.id not in peer.seen
+        peer.receive_transaction(genuine)
+    assert genuine.id in peer.seen
+    assert peer.network.unverified_transaction_pool.get(genuine.id) is genuine
+    assert peer.invalid == 1
+
+
+def test_rejected_transaction_is_not_marked_seen():
+    peer, transactions = start_peer(2)
+    genuine = transactions[0]
+    # the id matches the fields, but the signature does not
+    signature = [genuine.signature[0][::-1]] + genuine.signature[1:]
+    forged = Transaction(Transaction.compute_id(genuine.input, genuine.output, signature), genuine.input, genuine.output, signature, genuine.type)
+    with benchmark.quiet():
+        peer.receive_transaction(forged)
+    assert forged.id not in peer.seen
+    assert peer.network.unverified_transaction_pool.get(forged.id) is None
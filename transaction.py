@@ -2,34 +2,115 @@
 # This file defines the transaction data structure that allows for value transactions on the network
 
 from user import User
+import serialization
+
+import hashlib
+import sys
+
+
+def intern(value):
+    # share one copy of each id and public key between every transaction that refers to it
+    return sys.intern(value) if type(value) == str else value
+
 
 class Transaction:
+    # the fields are slots rather than a nested dict : transactions are the most numerous objects
+    # in the pools, and the validation loops read their fields over and over
+    __slots__ = ('id', 'input', 'output', 'signature', 'type', '_serialized', '_signing_message', '_signers')
+    FIELDS = ('id', 'input', 'output', 'signature')
 
     def __init__(self, id=None, input=[], output={}, signature=[], type=None):
-        self.data = {
-            'transaction': 
-            {
-                'id': id,                             # hash of this block 
-                'input': input,                       # list of transactions that we refer to  
-                'output': output,                     # transaction details : {public key of reciever : amount to be transferred}
-                'signature': signature,               # 
-                #following items are done after mining
-                'ptr_prev_trans': None,               # reference to the transaction immediately before this one in "time"
-                'nonce': 0,                           # the guess that solved the blockchain genesis
-                'proof_of_work': 0x00                 # hash (this transaction) that satisfies proof requirements; deinsentivising cheating
-            }
-        }
-        self.type = type
-        
-    def is_valid(self, unverified_transaction_pool, verified_transaction_pool):
+        self.id = intern(id)                # hash of the input, output and signatures
+        # list of transactions that we refer to
+        self.input = [intern(i) for i in input] if isinstance(input, list) else input
+        # transaction details : {public key of reciever : amount to be transferred}
+        self.output = {intern(key): amount for key, amount in output.items()} if isinstance(output, dict) else output
+        self.signature = signature
+        # the pointer to the previous block, nonce and proof of work are in the header of the block (see Block)
+        self.type = intern(type)
+        # cached canonical encodings
+        self._serialized = None
+        self._signing_message = None
+        # the public key found to have signed each input : {input index : public key}
+        self._signers = None
+
+    @property
+    def data(self):
+        # the fields in the old nested layout, data['transaction'][field], for code that still uses it
+        return {'transaction': TransactionFields(self)}
+
+    # canonical encodings used for hashing and signing
+    def serialize(self):
+        # encode the transaction, as committed to by the merkle root of its block
+        if self._serialized is None:
+            self._serialized = serialization.encode({
+                'id': self.id,
+                'input': self.input,
+                'output': self.output,
+                'signature': self.signature,
+                'type': self.type
+            })
+        return self._serialized
+
+    def deserialize(data):
+        # rebuild a transaction from its canonical encoding (see serialize)
+        return Transaction(**serialization.decode(data))
+
+    def signing_message(type, input, output):
+        # the message that each sender signs
+        return serialization.encode({'type': type, 'input': input, 'output': output})
+
+    def compute_id(input, output, signature):
+        # the transaction id is the hash of its input, output and signatures
+        return hashlib.sha256(serialization.encode({'input': input, 'output': output, 'signature': signature})).hexdigest()
+
+    def has_valid_id(self):
+        # verify that the id is the hash of the transaction's own fields
+        return self.id == Transaction.compute_id(self.input, self.output, self.signature)
+
+    def own_signing_message(self):
+        if self._signing_message is None:
+            self._signing_message = Transaction.signing_message(self.type, self.input, self.output)
+        return self._signing_message
+
+    def is_signed_by(self, public_key, signature):
+        # check that the signature was made with the public key over this transaction's signing message
+        message = User.check_signature(public_key, signature)
+        return message is not None and message == self.own_signing_message()
+
+    def find_signer(self, idx, public_keys):
+        # return the public key among public_keys that signed input idx, or None
+        # the genesis output has a key for every user, so the key that was found is remembered
+        # (see record_signer) instead of checking every key again each time the transaction is validated
+        signer = self.recorded_signer(idx)
+        if signer is not None and signer in public_keys:
+            return signer
+        signature = self.signature[idx]
+        for key in public_keys:
+            if self.is_signed_by(key, signature):
+                self.record_signer(idx, key)
+                return key
+        return None
+
+    def recorded_signer(self, idx):
+        return self._signers.get(idx) if self._signers is not None else None
+
+    def record_signer(self, idx, public_key):
+        # remember that the signature of input idx was verified to be public_key's over the signing message
+        # (it is forgotten if the fields change, see TransactionFields)
+        if self._signers is None:
+            self._signers = {}
+        self._signers[idx] = public_key
+
+    def is_valid(self, unverified_transaction_pool, verified_outputs):
         # checks if a transaction is a valid input to the unverified transaction pool
         if not self.has_valid_req_structure(): 
             print("structural error")
             return False
-        if not self.has_valid_sender(unverified_transaction_pool, verified_transaction_pool): 
+        if not self.has_valid_sender(unverified_transaction_pool, verified_outputs): 
             print("valid sender error")
             return False
-        if not self.has_sufficient_funds(unverified_transaction_pool, verified_transaction_pool): 
+        if not self.has_sufficient_funds(unverified_transaction_pool, verified_outputs): 
             print("insufficient funds")
             return False
         return True
@@ -38,99 +119,65 @@ class Transaction:
         # vefify that the structure of the required fields is correct
 
         # verify that the input is structured properly
-        if type(self.data['transaction']['input']) != list: return False
-        if len(self.data['transaction']['input']) < 1: return False
-        for input in self.data['transaction']['input']:
+        if type(self.input) != list: return False
+        if len(self.input) < 1: return False
+        for input in self.input:
             if type(input) != str: return False
             # if len(input) != 1: return False
 
         # verify that the output is structured properly
-        if type(self.data['transaction']['output']) != dict: return False
-        if len(self.data['transaction']['output']) != 1: return False
-        if type(list(self.data['transaction']['output'].keys())[0]) != str: return False
-        if type(list(self.data['transaction']['output'].values())[0]) != int: return False
-        if not list(self.data['transaction']['output'].values())[0] > 0: return False
+        if type(self.output) != dict: return False
+        if len(self.output) != 1: return False
+        if type(list(self.output.keys())[0]) != str: return False
+        if type(list(self.output.values())[0]) != int: return False
+        # the amount must be encodable, as the signing message and the id are computed from the encoding
+        if not 0 < list(self.output.values())[0] <= serialization.MAX_INT: return False
 
         # verify that the signature is structured properly
-        if type(self.data['transaction']['signature']) != list: return False
-        if len(self.data['transaction']['input']) != len(self.data['transaction']['signature']): return False
-        for signature in self.data['transaction']['signature']:
+        if type(self.signature) != list: return False
+        if len(self.input) != len(self.signature): return False
+        for signature in self.signature:
             if type(signature) != str: return False
 
         if not self.has_valid_type(): return False
 
         return True
 
-    def has_valid_addl_structure(self):
-        # vefify that the structure of the optional fields is correct (fields that are added before it is appended to the blockchain)
-
-        # verify that the ptr_prev_trans is structured properly
-        if type(self.data['transaction']['ptr_prev_trans']) != str: return False
-
-        # verify that the nonce is structured properly
-        if type(self.data['transaction']['nonce']) != int: return False
-
-        # verify that the proof of work is structured properly
-        if type(self.data['transaction']['proof_of_work']) != str: return False
-
-        return True
-
-    def find_trans_output(self, idx,  unverified_transaction_pool, verified_transaction_pool):
-        id = self.data['transaction']['input'][idx]
-        outputs = {}
-        # add all matching transaction outputs from the unverified transaction pool
-        if id in unverified_transaction_pool.keys():
-            for key in unverified_transaction_pool[id].data['transaction']['output']:
-                outputs[key] = unverified_transaction_pool[id].data['transaction']['output'][key]
-        # add all matching transaction outputs from the verified transaction pool
-        for trans in verified_transaction_pool:
-            if id == trans.data['transaction']['id']:
-                for key in trans.data['transaction']['output']:
-                    outputs[key] = trans.data['transaction']['output'][key]
+    def find_trans_output(self, idx, unverified_transaction_pool, verified_outputs):
+        # verified_outputs maps the id of each verified transaction to its output (see UTXOSet)
+        # the returned dict must not be modified : it is only copied when both pools have the transaction
+        id = self.input[idx]
+        unverified = unverified_transaction_pool.get(id)
+        verified = verified_outputs.get(id)
+        if verified is None:
+            return unverified.output if unverified is not None else {}
+        if unverified is None:
+            return verified
+        # add all matching transaction outputs from the unverified transaction pool, then the verified transaction pool
+        outputs = dict(unverified.output)
+        outputs.update(verified)
         return outputs 
 
-    def has_valid_sender(self, unverified_transaction_pool, verified_transaction_pool):
+    def has_valid_sender(self, unverified_transaction_pool, verified_outputs):
         # verify the sender on the previous transaction
-        for input in range(len(self.data['transaction']['input'])):
-            signature = self.data['transaction']['signature'][input]
+        for input in range(len(self.input)):
             # check each public key in the input, in case it is the genesis block
-            public_keys = self.find_trans_output(input, unverified_transaction_pool, verified_transaction_pool).keys()
-            found = False
-            for key in public_keys:
-                try:
-                    User.verify_signature(key, signature)
-                    found = True
-                    break
-                except:
-                    continue
-            if not found:
+            public_keys = self.find_trans_output(input, unverified_transaction_pool, verified_outputs).keys()
+            if self.find_signer(input, public_keys) is None:
                 return False
         return True
 
-    def has_sufficient_funds(self, unverified_transaction_pool, verified_transaction_pool):
+    def has_sufficient_funds(self, unverified_transaction_pool, verified_outputs):
         sender_funds = {}
         # find the funds allocated by each sender and verify they are sufficient
-        for input in range(len(self.data['transaction']['input'])):
-            # keep track of which sender we are looking for using the signature
-            signature = self.data['transaction']['signature'][input]
+        for input in range(len(self.input)):
             # check each public key in the input, in case it is the genesis block
-            output = self.find_trans_output(input, unverified_transaction_pool, verified_transaction_pool)
-            # found = False
-            for key in output.keys():
-                try:
-                    User.verify_signature(key, signature)
-                    # we have found a sender
-                    if key in sender_funds.keys():
-                        sender_funds[key] = sender_funds[key] + output[key]
-                    else:
-                        sender_funds[key] = output[key]
-                    # found = True
-                    # break
-                except:
-                    continue
-            # if not found:
-            #     return False
-        return sum(list(sender_funds.values())) >= list(self.data['transaction']['output'].values())[0]
+            output = self.find_trans_output(input, unverified_transaction_pool, verified_outputs)
+            key = self.find_signer(input, output.keys())
+            if key is not None:
+                # we have found a sender
+                sender_funds[key] = sender_funds.get(key, 0) + output[key]
+        return sum(list(sender_funds.values())) >= list(self.output.values())[0]
 
     # def has_sufficient_funds(self, unverified_transaction_pool):
     #     # verify that the sender has sufficient funds to cover the transaction
@@ -156,14 +203,14 @@ class Transaction:
         if self.type == 'TRANS':
             # one input 
             # one output
-            if len(self.data['transaction']['input']) != 1: return False
-            if len(self.data['transaction']['output']) != 1: return False
+            if len(self.input) != 1: return False
+            if len(self.output) != 1: return False
                 
         elif self.type == 'MERGE':
             # multiple inputs
             # one output
-            if len(self.data['transaction']['input']) == 1: return False
-            if len(self.data['transaction']['output']) != 1: return False
+            if len(self.input) == 1: return False
+            if len(self.output) != 1: return False
             # inputs are all from the same entity
             # set removes duplicates
             # senders_without_dups = set(map(lambda output: list(output.keys())[0], self.data['transaction']['input']))
@@ -173,8 +220,8 @@ class Transaction:
         elif self.type == 'JOIN':
             # multiple inputs
             # one output
-            if len(self.data['transaction']['input']) == 1: return False
-            if len(self.data['transaction']['output']) != 1: return False
+            if len(self.input) == 1: return False
+            if len(self.output) != 1: return False
             # inputs are from multiple entities
             # set removes duplicates
             # senders_without_dups = set(map(lambda output: list(output.keys())[0], self.data['transaction']['input']))
@@ -187,24 +234,64 @@ class Transaction:
         return True
 
     def display(self):
-        if len(self.data['transaction']['input']) == 0:
+        if len(self.input) == 0:
             print("\n   GENESIS TRANSACTION")
         else:
             print("\n   transaction")
-        print("\tid:             {}".format(self.data['transaction']['id']))
-        for input in self.data['transaction']['input']:
-            if input == self.data['transaction']['input'][0]:
+        print("\tid:             {}".format(self.id))
+        for input in self.input:
+            if input == self.input[0]:
                 print("\tinput(s):       {}".format(input))
             else:
                 print("\t                {}".format(input))
-        print("\toutput:         {}".format(self.data['transaction']['output']))
-        for signature in self.data['transaction']['signature']:
-            if signature == self.data['transaction']['signature'][0]:
+        print("\toutput:         {}".format(self.output))
+        for signature in self.signature:
+            if signature == self.signature[0]:
                 print("\tsignature(s):   {}...".format(signature[:10]))
             else:
                 print("\t                {}...".format(signature[:10]))
-        print("\tptr_prev_trans: {}".format(self.data['transaction']['ptr_prev_trans']))
-        print("\tnonce:          {}".format(self.data['transaction']['nonce']))
-        print("\tproof_of_work:  {}".format(self.data['transaction']['proof_of_work']))
         print("\ttype:           {}".format(self.type))
-        print()
\ No newline at end of file
+        print()
+
+
+class TransactionFields:
+    # a dict-like view of the fields of a transaction (see Transaction.data)
+    __slots__ = ('transaction',)
+
+    def __init__(self, transaction):
+        self.transaction = transaction
+
+    def __getitem__(self, field):
+        if field not in Transaction.FIELDS:
+            raise KeyError(field)
+        return getattr(self.transaction, field)
+
+    def __setitem__(self, field, value):
+        if field not in Transaction.FIELDS:
+            raise KeyError(field)
+        setattr(self.transaction, field, value)
+        # the cached encodings no longer match the fields
+        self.transaction._serialized = None
+        self.transaction._signing_message = None
+        self.transaction._signers = None
+
+    def get(self, field, default=None):
+        return getattr(self.transaction, field) if field in Transaction.FIELDS else default
+
+    def keys(self):
+        return list(Transaction.FIELDS)
+
+    def values(self):
+        return [getattr(self.transaction, field) for field in Transaction.FIELDS]
+
+    def items(self):
+        return [(field, getattr(self.transaction, field)) for field in Transaction.FIELDS]
+
+    def __contains__(self, field):
+        return field in Transaction.FIELDS
+
+    def __iter__(self):
+        return iter(Transaction.FIELDS)
+
+    def __len__(self):
+        return len(Transaction.FIELDS)
@@ -1,5 +1,9 @@
 import json
 import hashlib
+import argparse
+import multiprocessing
+import os
+import random
 
 from transaction import Transaction
 from user import User
@@ -9,8 +13,55 @@ from nacl.public import PrivateKey, Box
 
 # instruction to simulate a set of transactions
 
+# transaction files are newline-delimited JSON : one transaction record per line, so that
+# they can be written and read a transaction at a time whatever their size
+GENESIS_FILE = 'genesis_transaction_file.ndjson'
 
-def create():
+
+def write(path, records, batch_size=1024):
+    # write transaction records to a file, flushing every batch_size records
+    # records can be any iterable (such as a generator), and only one batch is held in memory
+    # return the number of records written
+    count = 0
+    with open(path, 'w') as outfile:
+        batch = []
+        for record in records:
+            batch.append(json.dumps(record, separators=(',', ':')))
+            if len(batch) == batch_size:
+                outfile.write('\n'.join(batch) + '\n')
+                outfile.flush()
+                count += len(batch)
+                batch = []
+        if len(batch) > 0:
+            outfile.write('\n'.join(batch) + '\n')
+            count += len(batch)
+    return count
+
+
+def read(path):
+    # yield the transaction records of a file one at a time
+    with open(path, 'r') as infile:
+        for line in infile:
+            if line.strip():
+                yield json.loads(line)
+
+
+def to_transaction(record):
+    return Transaction(
+        id=record['NUMBER'],
+        input=record['INPUT'],
+        output=record['OUTPUT'],
+        signature=record['SIGNATURE'],
+        type=record['TYPE'])
+
+
+def read_transactions(path):
+    # yield a transaction object for each record of a file
+    for record in read(path):
+        yield to_transaction(record)
+
+
+def create(path=GENESIS_FILE):
     # Create 5 distinct identities ( public - key pairs )
     user1 = User()
     user2 = User()
@@ -33,7 +84,7 @@ def create():
     signature_fields = []
 
     data['transactions'].append({
-        'NUMBER': hashlib.sha256((''.join(input) + str(output) + ''.join(signature_fields)).encode()).hexdigest(),
+        'NUMBER': Transaction.compute_id(input, output, signature_fields),
         'TYPE': 'TRANS',
         'INPUT': input,                # a set of transaction numbers
         'OUTPUT': output,              # a set of (value:public key) pairs
@@ -44,10 +95,10 @@ def create():
     type = 'TRANS'
     input = [data['transactions'][0]['NUMBER']]
     output = {User.get_serialized_public_key(user1.public_key): 15}
-    signature_fields = [user1.sign(type+''.join(input)+str(output))] 
+    signature_fields = [user1.sign(Transaction.signing_message(type, input, output))] 
 
     data['transactions'].append({
-        'NUMBER': hashlib.sha256((''.join(input) + str(output) + ''.join(signature_fields)).encode()).hexdigest(),
+        'NUMBER': Transaction.compute_id(input, output, signature_fields),
         'TYPE': type,
         'INPUT': input,                # a set of transaction numbers
         'OUTPUT': output,              # a set of (value:public key) pairs
@@ -58,10 +109,10 @@ def create():
     type = 'TRANS'
     input = [data['transactions'][0]['NUMBER']]
     output = {User.get_serialized_public_key(user2.public_key) : 5}
-    signature_fields = [user2.sign(type+''.join(input)+str(output))]
+    signature_fields = [user2.sign(Transaction.signing_message(type, input, output))]
 
     data['transactions'].append({
-        'NUMBER': hashlib.sha256((''.join(input) + str(output) + ''.join(signature_fields)).encode()).hexdigest(),
+        'NUMBER': Transaction.compute_id(input, output, signature_fields),
         'TYPE': type,
         'INPUT': input,                # a set of transaction numbers
         'OUTPUT': output,              # a set of (value:public key) pairs
@@ -72,10 +123,10 @@ def create():
     type = 'TRANS'
     input = [data['transactions'][0]['NUMBER']]
     output = {User.get_serialized_public_key(user3.public_key) : 5}
-    signature_fields = [user3.sign(type+''.join(input)+str(output))]
+    signature_fields = [user3.sign(Transaction.signing_message(type, input, output))]
 
     data['transactions'].append({
-        'NUMBER': hashlib.sha256((''.join(input) + str(output) + ''.join(signature_fields)).encode()).hexdigest(),
+        'NUMBER': Transaction.compute_id(input, output, signature_fields),
         'TYPE': type,
         'INPUT': input,                # a set of transaction numbers
         'OUTPUT': output,              # a set of (value:public key) pairs
@@ -86,10 +137,10 @@ def create():
     type = 'JOIN'
     input = [data['transactions'][2]['NUMBER'], data['transactions'][3]['NUMBER']]
     output = {User.get_serialized_public_key(user1.public_key) : 10}
-    signature_fields = [user2.sign(type+''.join(input)+str(output)), user3.sign(type+''.join(input)+str(output))]
+    signature_fields = [user2.sign(Transaction.signing_message(type, input, output)), user3.sign(Transaction.signing_message(type, input, output))]
 
     data['transactions'].append({
-        'NUMBER': hashlib.sha256((''.join(input) + str(output) + ''.join(signature_fields)).encode()).hexdigest(),
+        'NUMBER': Transaction.compute_id(input, output, signature_fields),
         'TYPE': type,
         'INPUT': input,                # a set of transaction numbers
         'OUTPUT': output,              # a set of (value:public key) pairs
@@ -100,10 +151,10 @@ def create():
     type = 'MERGE'
     input = [data['transactions'][1]['NUMBER'], data['transactions'][4]['NUMBER']]
     output = {User.get_serialized_public_key(user1.public_key) : 25}
-    signature_fields = [user1.sign(type+''.join(input)+str(output)), user1.sign(type+''.join(input)+str(output))]
+    signature_fields = [user1.sign(Transaction.signing_message(type, input, output)), user1.sign(Transaction.signing_message(type, input, output))]
 
     data['transactions'].append({
-        'NUMBER': hashlib.sha256((''.join(input) + str(output) + ''.join(signature_fields)).encode()).hexdigest(),
+        'NUMBER': Transaction.compute_id(input, output, signature_fields),
         'TYPE': type,
         'INPUT': input,                # a set of transaction numbers
         'OUTPUT': output,              # a set of (value:public key) pairs
@@ -114,10 +165,10 @@ def create():
     type = 'TRANS'
     input = [data['transactions'][5]['NUMBER']]
     output = {User.get_serialized_public_key(user2.public_key) : 25}
-    signature_fields = [user1.sign(type+''.join(input)+str(output))]
+    signature_fields = [user1.sign(Transaction.signing_message(type, input, output))]
 
     data['transactions'].append({
-        'NUMBER': hashlib.sha256((''.join(input) + str(output) + ''.join(signature_fields)).encode()).hexdigest(),
+        'NUMBER': Transaction.compute_id(input, output, signature_fields),
         'TYPE': type,
         'INPUT': input,                # a set of transaction numbers
         'OUTPUT': output,              # a set of (value:public key) pairs
@@ -128,10 +179,10 @@ def create():
     type = 'TRANS'
     input = [data['transactions'][5]['NUMBER']]
     output = {User.get_serialized_public_key(user3.public_key) : 25}
-    signature_fields = [user1.sign(type+''.join(input)+str(output))]
+    signature_fields = [user1.sign(Transaction.signing_message(type, input, output))]
 
     data['transactions'].append({
-        'NUMBER': hashlib.sha256((''.join(input) + str(output) + ''.join(signature_fields)).encode()).hexdigest(),
+        'NUMBER': Transaction.compute_id(input, output, signature_fields),
         'TYPE': type,
         'INPUT': input,                # a set of transaction numbers
         'OUTPUT': output,              # a set of (value:public key) pairs
@@ -142,10 +193,10 @@ def create():
     type = 'TRANS'
     input = [data['transactions'][6]['NUMBER']]
     output = {User.get_serialized_public_key(user4.public_key) : 25}
-    signature_fields = [user2.sign(type+''.join(input)+str(output))]
+    signature_fields = [user2.sign(Transaction.signing_message(type, input, output))]
 
     data['transactions'].append({
-        'NUMBER': hashlib.sha256((''.join(input) + str(output) + ''.join(signature_fields)).encode()).hexdigest(),
+        'NUMBER': Transaction.compute_id(input, output, signature_fields),
         'TYPE': type,
         'INPUT': input,                # a set of transaction numbers
         'OUTPUT': output,              # a set of (value:public key) pairs
@@ -156,10 +207,10 @@ def create():
     type = 'TRANS'
     input = [data['transactions'][8]['NUMBER']]
     output = {User.get_serialized_public_key(user5.public_key) : 25}
-    signature_fields = [user5.sign(type+''.join(input)+str(output))]
+    signature_fields = [user5.sign(Transaction.signing_message(type, input, output))]
 
     data['transactions'].append({
-        'NUMBER': hashlib.sha256((''.join(input) + str(output) + ''.join(signature_fields)).encode()).hexdigest(),
+        'NUMBER': Transaction.compute_id(input, output, signature_fields),
         'TYPE': type,
         'INPUT': input,                # a set of transaction numbers
         'OUTPUT': output,              # a set of (value:public key) pairs
@@ -170,10 +221,10 @@ def create():
     type = 'TRANS'
     input = [data['transactions'][8]['NUMBER']]
     output = {User.get_serialized_public_key(user5.public_key) : 25}
-    signature_fields = [user4.sign(type+''.join(input)+str(output))]
+    signature_fields = [user4.sign(Transaction.signing_message(type, input, output))]
 
     data['transactions'].append({
-        'NUMBER': hashlib.sha256((''.join(input) + str(output) + ''.join(signature_fields)).encode()).hexdigest(),
+        'NUMBER': Transaction.compute_id(input, output, signature_fields),
         'TYPE': type,
         'INPUT': input,                # a set of transaction numbers
         'OUTPUT': output,              # a set of (value:public key) pairs
@@ -183,12 +234,183 @@ def create():
     
     
     
-    # convert to json object
-    with open('genesis_transaction_file.json', 'w') as outfile:
-        json.dump(data, outfile)
+    # write one json object per line
+    write(path, data['transactions'])
+
+# synthetic workloads
+# the genesis transaction pays every user GENESIS_AMOUNT, and (as the genesis outputs can be spent
+# more than once) each user can draw on it again, so the workload never runs out of coins
+# each draw is one less than the last, so that two draws never give the same transaction
+GENESIS_AMOUNT = 10**9
+# how many spent coins are remembered as targets for double spends
+SPENT_HISTORY = 1024
+
+# the users of a workload, rebuilt from the seed in each signing process
+_signers = None
+
+
+def user_seed(seed, index):
+    return hashlib.sha256('{}:{}'.format(seed, index).encode('utf-8')).digest()
+
+
+def _init_signers(seed, num_users):
+    global _signers
+    _signers = [User(user_seed(seed, index)) for index in range(num_users)]
+
+
+def _sign_chunk(jobs):
+    # sign each (message, [index of the user that signs each input]) job
+    return [[_signers[signer].sign(message) for signer in signers] for message, signers in jobs]
+
+
+def generate(users=100, count=100000, mix=None, double_spend_rate=0.01, invalid_signature_rate=0.01,
+             seed=0, num_workers=None, chunk_size=4096):
+    # yield the records of a reproducible workload : the genesis transaction, then count transactions
+    # of the types in mix ({type : weight}) that spend the outputs of the transactions before them,
+    # with the given fractions of double spends and transactions with invalid signatures
+    # the choices are made in this process and the signing is spread across num_workers processes,
+    # a chunk at a time, so the output is the same whatever the number of workers
+    mix = mix or {'TRANS': 0.8, 'MERGE': 0.1, 'JOIN': 0.1}
+    types, weights = list(mix.keys()), list(mix.values())
+    rng = random.Random(seed)
+    num_workers = num_workers or os.cpu_count() or 1
+    pool = None
+    if num_workers > 1:
+        pool = multiprocessing.Pool(num_workers, initializer=_init_signers, initargs=(seed, users))
+    else:
+        _init_signers(seed, users)
+    keys = [User.get_serialized_public_key(User(user_seed(seed, index)).public_key) for index in range(users)]
+
+    try:
+        # 0 : genesis
+        output = {key: GENESIS_AMOUNT for key in keys}
+        genesis_id = Transaction.compute_id([], output, [])
+        yield {'NUMBER': genesis_id, 'TYPE': 'TRANS', 'INPUT': [], 'OUTPUT': output, 'SIGNATURE': []}
+
+        # the coins that can be spent : (transaction id, index of the owner, amount)
+        # the genesis coins are never removed
+        coins = [(genesis_id, owner, GENESIS_AMOUNT) for owner in range(users)]
+        positions = {}
+        owned = {owner: [] for owner in range(users)}
+        spent = []
+        draws = [0]*users
+
+        def draw(coin):
+            # give a genesis coin the amount of the owner's next draw
+            if coin[0] != genesis_id:
+                return coin
+            draws[coin[1]] += 1
+            return (genesis_id, coin[1], GENESIS_AMOUNT - draws[coin[1]])
+
+        def add(coin):
+            positions[coin[0]] = len(coins)
+            coins.append(coin)
+            owned[coin[1]].append(coin)
+
+        def take(coin):
+            if coin[0] == genesis_id:
+                return
+            index = positions.pop(coin[0])
+            last = coins.pop()
+            if index < len(coins):
+                coins[index] = last
+                positions[last[0]] = index
+            owned[coin[1]].remove(coin)
+            spent.append(coin)
+            if len(spent) > SPENT_HISTORY:
+                spent.pop(0)
+
+        produced = 0
+        while produced < count:
+            # choose the spends of a chunk; the coins created in the chunk can only be spent in later
+            # chunks, once their ids (which depend on the signatures) are known
+            specs = []
+            while len(specs) < min(chunk_size, count - produced):
+                roll = rng.random()
+                coin = draw(rng.choice(coins))
+                recipient = rng.randrange(users)
+                if roll < double_spend_rate and len(spent) > 0:
+                    # spend a coin that has already been spent, paying one less than the coin : every other
+                    # spend pays all of its inputs, so this cannot be the same transaction as the first spend
+                    coin = rng.choice(spent)
+                    specs.append(('TRANS', [coin], recipient, coin[2] - 1, coin[2] - 1, False))
+                elif roll < double_spend_rate + invalid_signature_rate:
+                    # sign a different amount than the one paid, so that the signature fits no key
+                    specs.append(('TRANS', [coin], recipient, coin[2], coin[2] + 1, False))
+                else:
+                    type = rng.choices(types, weights)[0]
+                    inputs = [coin]
+                    if type == 'MERGE':
+                        # more coins of the same owner
+                        others = [other for other in owned[coin[1]] if other[0] != coin[0]]
+                        inputs += rng.sample(others, min(len(others), rng.randint(1, 2)))
+                    elif type == 'JOIN':
+                        # a coin of another owner
+                        other = rng.choice(coins)
+                        if other[1] != coin[1]:
+                            inputs.append(draw(other))
+                    if len(inputs) == 1:
+                        type = 'TRANS'
+                    for input in inputs:
+                        take(input)
+                    amount = sum(input[2] for input in inputs)
+                    specs.append((type, inputs, recipient, amount, amount, True))
+
+            # sign the chunk : each input is signed by the owner of the coin it spends
+            jobs = []
+            for type, inputs, recipient, amount, signed_amount, valid in specs:
+                input = [coin[0] for coin in inputs]
+                jobs.append((Transaction.signing_message(type, input, {keys[recipient]: signed_amount}), [coin[1] for coin in inputs]))
+            if pool is not None:
+                size = -(-len(jobs) // num_workers)
+                signatures = [result for results in pool.map(_sign_chunk, [jobs[i:i+size] for i in range(0, len(jobs), size)]) for result in results]
+            else:
+                signatures = _sign_chunk(jobs)
+
+            for (type, inputs, recipient, amount, signed_amount, valid), signature in zip(specs, signatures):
+                input = [coin[0] for coin in inputs]
+                output = {keys[recipient]: amount}
+                id = Transaction.compute_id(input, output, signature)
+                yield {'NUMBER': id, 'TYPE': type, 'INPUT': input, 'OUTPUT': output, 'SIGNATURE': signature}
+                if valid:
+                    add((id, recipient, amount))
+            produced += len(specs)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def create_workload(path, **parameters):
+    # stream a generated workload to a file (see generate)
+    return write(path, generate(**parameters))
+
 
 def main():
-    create()
+    parser = argparse.ArgumentParser(description="create a transaction file")
+    parser.add_argument("--output", default=GENESIS_FILE, help="file to write")
+    parser.add_argument("--count", type=int, default=None, help="number of transactions to generate (the hand-written file if not given)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--mix", type=float, nargs=3, default=[0.8, 0.1, 0.1], metavar=("TRANS", "MERGE", "JOIN"), help="weights of the transaction types")
+    parser.add_argument("--double-spend-rate", type=float, default=0.01)
+    parser.add_argument("--invalid-signature-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.count is None:
+        create(args.output)
+        return
+    written = create_workload(
+        args.output,
+        users=args.users,
+        count=args.count,
+        mix=dict(zip(['TRANS', 'MERGE', 'JOIN'], args.mix)),
+        double_spend_rate=args.double_spend_rate,
+        invalid_signature_rate=args.invalid_signature_rate,
+        seed=args.seed,
+        num_workers=args.workers)
+    print("wrote {} transactions to {}".format(written, args.output))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,440 @@
+# Description:
+# Runs each node in its own process with its own replica of the network, connected to a few
+# peers by multiprocessing pipes. Transactions and blocks are gossiped by inventory: a node
+# announces the ids of anything new and valid to every peer except the one it came from, and
+# a peer requests only the ids it has not seen, so each payload crosses each link at most
+# once. A bounded set of the ids already seen or requested keeps a node from validating or
+# forwarding anything twice. Each link can delay messages by a fixed latency and limit them
+# to a bandwidth, so propagation delay and the forks it causes show up as they would
+# between machines.
+#
+# Messages are a one-byte kind followed by a payload:
+#   I   an inventory : the encoded list of [kind, id] of the transactions ('T') and blocks ('B') the sender has
+#   G   a request for the transactions and blocks in an encoded list of [kind, id]
+#   T   a transaction, in its canonical encoding (see Transaction.serialize)
+#   B   a block, in its canonical encoding (see Block.serialize)
+#   Q   a request for statistics, answered on the control pipe (from the cluster only)
+#   S   stop the node and report its statistics (from the cluster only)
+
+from network import Network
+from node import Node
+from miner import Miner
+from block import Block
+from block_tree import BlockTree
+from transaction import Transaction
+from lru_cache import LRUCache
+import difficulty
+import serialization
+
+from collections import deque
+from multiprocessing.connection import wait
+import contextlib
+import multiprocessing
+import os
+import random
+import threading
+import time
+
+
+class Link:
+    # the sending end of a connection to a peer, delaying each message by the latency and
+    # the time its bytes take to cross the link at the bandwidth (in bytes per second)
+
+    def __init__(self, connection, latency=0.0, bandwidth=None):
+        self.connection = connection
+        self.latency = latency
+        self.bandwidth = bandwidth
+        # messages waiting to be delivered : (time they are due, message), in the order they were sent
+        self.queue = deque()
+        # when the link finishes sending the last queued message
+        self.free_at = 0.0
+        self.condition = threading.Condition()
+        self.closed = False
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def send(self, message):
+        with self.condition:
+            start = max(time.monotonic(), self.free_at)
+            self.free_at = start + (len(message) / self.bandwidth if self.bandwidth else 0.0)
+            self.queue.append((self.free_at + self.latency, message))
+            self.messages_sent += 1
+            self.bytes_sent += len(message)
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.closed or len(self.queue) > 0)
+                if self.closed:
+                    return
+                due, message = self.queue[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    # wait for the message to be due (or for the link to close)
+                    self.condition.wait(delay)
+                    continue
+                self.queue.popleft()
+            try:
+                self.connection.send_bytes(message)
+            except (OSError, EOFError):
+                return
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class Peer:
+    # a node in its own process, with its own replica of the network
+
+    def __init__(self, index, connections, genesis, min_zeros_msb=4, block_interval=None, block_size=100, latency=0.0, bandwidth=None, seen_size=65536, request_timeout=2.0):
+        self.index = index
+        # the first blocks need min_zeros_msb leading zero nibbles, and the target is then retargeted
+        # towards block_interval (if it is given)
+        self.network = Network(difficulty=difficulty.DifficultyController(difficulty.target_for_zeros(min_zeros_msb), block_interval))
+        genesis = Block.deserialize(genesis)
+        self.network.push_block_vtp(genesis)
+        # the node mines in this process's own thread
+        self.node = Node(self.network, Miner(0), block_size)
+        # the links to the peers : {connection their messages arrive on : link to send to them}
+        self.links = {connection: Link(connection, latency, bandwidth) for connection in connections}
+        # every block this peer has seen, to choose the chain with the most work
+        self.block_tree = BlockTree(difficulty.block_work)
+        self.block_tree.add(genesis)
+        # ids of the transactions and blocks already seen, so that nothing is handled twice
+        self.seen = LRUCache(seen_size)
+        self.seen.put(genesis.id(), True)
+        # ids requested from a peer that have not arrived yet : {id : time of the request}
+        # an id announced again after request_timeout is requested from the peer that announced it
+        self.requested = LRUCache(seen_size)
+        self.request_timeout = request_timeout
+        # ids to announce to each peer at the next flush : {link : [[kind, id]]}
+        self.inventory = {link: [] for link in self.links.values()}
+        self.inventory_lock = threading.Lock()
+        # blocks whose parent has not arrived yet : {ptr_prev : [blocks]}
+        self.orphans = {}
+        # ids of the blocks that could not be added to the chain, so that the blocks built on them are rejected
+        self.invalid_blocks = LRUCache(seen_size)
+        # transactions that spend an output that has not arrived yet : {missing input id : [transactions]}
+        self.waiting = {}
+        self.mined = 0
+        self.invalid = 0
+        # ids announced by peers that this node already had, and ids it requested
+        self.duplicates = 0
+        self.requests = 0
+        self.network.subscribe_new_blocks(self.on_new_block)
+
+    def announce(self, kind, id, exclude=None):
+        # queue an id to be announced to every peer except the one it came from
+        with self.inventory_lock:
+            for link, items in self.inventory.items():
+                if link is not exclude:
+                    items.append([kind, id])
+
+    def flush_inventory(self):
+        # send the queued ids, one inventory message per peer
+        with self.inventory_lock:
+            for link, items in self.inventory.items():
+                if len(items) > 0:
+                    link.send(b'I' + serialization.encode(items))
+                    items.clear()
+
+    def has(self, kind, id):
+        if id in self.seen:
+            return True
+        if kind == 'B':
+            return id in self.block_tree or id in self.invalid_blocks
+        return self.network.contains_transaction(id)
+
+    def request(self, items, link):
+        # request the ids in items that this node has not seen and is not already waiting for
+        wanted = []
+        now = time.monotonic()
+        for kind, id in items:
+            if self.has(kind, id):
+                self.duplicates += 1
+                continue
+            requested_at = self.requested.get(id)
+            if requested_at is not None and now - requested_at < self.request_timeout:
+                continue
+            self.requested.put(id, now)
+            wanted.append([kind, id])
+        if len(wanted) > 0:
+            self.requests += len(wanted)
+            link.send(b'G' + serialization.encode(wanted))
+
+    def send_requested(self, items, link):
+        # answer a request with the transactions and blocks this node has
+        for kind, id in items:
+            if kind == 'T':
+                transaction = self.network.get_transaction(id)
+                if transaction is not None:
+                    link.send(b'T' + transaction.serialize())
+            elif kind == 'B':
+                block = self.block_tree.get(id)
+                if block is not None:
+                    link.send(b'B' + block.serialize())
+
+    def on_new_block(self, block):
+        # a block was added to the chain : if it was not received from a peer, this node mined it
+        if block.id() in self.seen:
+            return
+        self.seen.put(block.id(), True)
+        self.block_tree.add(block, block.data['header']['ptr_prev'])
+        self.mined += 1
+        self.announce('B', block.id())
+        self.flush_inventory()
+
+    # functions that handle the messages from peers
+    def handle(self, message, link=None):
+        kind, payload = message[:1], message[1:]
+        if kind == b'T':
+            self.receive_transaction(Transaction.deserialize(payload), link)
+        elif kind == b'B':
+            self.receive_block(Block.deserialize(payload), link)
+        elif kind == b'I':
+            self.request(serialization.decode(payload), link)
+        elif kind == b'G':
+            self.send_requested(serialization.decode(payload), link)
+
+    def receive_transaction(self, transaction, link=None):
+        if transaction.id in self.seen:
+            return
+        self.requested.pop(transaction.id)
+        # a forged copy of a transaction can carry the id of the genuine one, so a transaction is only
+        # marked as seen once its id is its own and it was accepted (or waits for the transaction it spends)
+        if not transaction.has_valid_req_structure() or not transaction.has_valid_id():
+            self.invalid += 1
+            return
+        self.add_transaction(transaction, link)
+
+    def add_transaction(self, transaction, link=None):
+        with self.network.lock:
+            missing = next((input for input in transaction.input if type(input) == str
+                            and input not in self.network.unverified_transaction_pool and input not in self.network.utxo_set), None)
+            if missing is not None:
+                # gossip does not keep messages in order : wait for the transaction it spends
+                self.seen.put(transaction.id, True)
+                self.waiting.setdefault(missing, []).append((transaction, link))
+                return
+            accepted = self.network.push_transaction_utp(transaction)
+        if accepted:
+            self.seen.put(transaction.id, True)
+            self.announce('T', transaction.id, link)
+            self.release_waiting(transaction.id)
+        else:
+            self.seen.pop(transaction.id)
+
+    def release_waiting(self, id):
+        for transaction, link in self.waiting.pop(id, []):
+            self.add_transaction(transaction, link)
+
+    def receive_block(self, block, link=None):
+        if block.id() in self.seen:
+            return
+        self.requested.pop(block.id())
+        # check what can be checked without the rest of the chain before passing it on
+        # an invalid copy of a block can carry the id of the valid block, so it is not marked as seen
+        if not block.has_valid_structure() or not block.has_valid_proof_of_work():
+            self.invalid += 1
+            return
+        parent = block.data['header']['ptr_prev']
+        # the block tree is shared with the miner thread, which adds the blocks it mines
+        with self.network.lock:
+            if parent in self.invalid_blocks:
+                self.reject_block(block.id())
+                return
+            if parent not in self.block_tree:
+                self.seen.put(block.id(), True)
+                self.orphans.setdefault(parent, []).append((block, link))
+                if link is not None:
+                    # ask the peer that sent the block for its parent, in case it was never announced to this node
+                    self.request([['B', parent]], link)
+                return
+            # check the target and timestamp against the branch the block extends, which may not be the chain
+            # (a timestamp too far ahead of the clock may become valid, so the block is not marked as seen)
+            header_at = lambda height: self.block_tree.ancestor(parent, height).data['header']
+            if not self.network.difficulty.is_valid(block.data['header'], self.block_tree.height(parent) + 1, header_at):
+                self.invalid += 1
+                return
+            self.seen.put(block.id(), True)
+            self.block_tree.add(block, parent)
+            self.adopt_best_chain()
+            if block.id() not in self.block_tree:
+                # the block could not be added to the chain (and its orphans were rejected with it)
+                return
+            self.announce('B', block.id(), link)
+            for orphan, orphan_link in self.orphans.pop(block.id(), []):
+                self.seen.pop(orphan.id())
+                self.receive_block(orphan, orphan_link)
+
+    def reject_block(self, id):
+        # remember that a block is invalid, along with the orphans waiting for it
+        self.invalid += 1
+        self.invalid_blocks.put(id, True)
+        for orphan, orphan_link in self.orphans.pop(id, []):
+            self.reject_block(orphan.id())
+
+    def adopt_best_chain(self):
+        # move the network's chain onto the branch of the block tree with the most work
+        with self.network.lock:
+            tip = self.network.blockchain[-1].id()
+            added = []
+            while self.block_tree.best_tip != tip:
+                removed, added = self.block_tree.path_diff(tip, self.block_tree.best_tip)
+                for block in removed:
+                    self.network.rollback_block_vtp()
+                pushed = []
+                for block in added:
+                    if not self.network.push_block_vtp(block):
+                        break
+                    pushed.append(block)
+                if len(pushed) == len(added):
+                    break
+                # the branch holds an invalid block : go back to the chain this node had, drop the
+                # invalid block and the blocks built on it from the tree, and try the next best branch
+                for block in pushed:
+                    self.network.rollback_block_vtp()
+                for block in reversed(removed):
+                    self.network.push_block_vtp(block)
+                for id in self.block_tree.remove(added[len(pushed)].id()):
+                    self.reject_block(id)
+                added = []
+        for block in added:
+            for transaction in block.data['transactions']:
+                self.release_waiting(transaction.id)
+
+    def stats(self):
+        with self.network.lock:
+            return {
+                'index': self.index,
+                'height': self.network.chain_length(),
+                'tip': self.network.blockchain[-1].id(),
+                'transactions': self.network.transaction_count(),
+                'unverified': len(self.network.unverified_transaction_pool),
+                'blocks_seen': len(self.block_tree),
+                'stale_blocks': len(self.block_tree) - self.network.chain_length(),
+                'mined': self.mined,
+                'invalid': self.invalid,
+                'duplicates': self.duplicates,
+                'requests': self.requests,
+                'messages_sent': sum(link.messages_sent for link in self.links.values()),
+                'bytes_sent': sum(link.bytes_sent for link in self.links.values()),
+                'hashes': self.node.miner.hashes
+            }
+
+    def run(self, control):
+        # mine in one thread and handle the messages from the peers and the cluster in this one
+        thread = threading.Thread(target=self.node.run)
+        thread.start()
+        connections = list(self.links) + [control]
+        try:
+            while True:
+                for connection in wait(connections):
+                    try:
+                        message = connection.recv_bytes()
+                    except EOFError:
+                        # the peer has stopped
+                        connections.remove(connection)
+                        continue
+                    if connection is control:
+                        if message == b'S':
+                            return
+                        if message == b'Q':
+                            control.send_bytes(serialization.encode(self.stats()))
+                            continue
+                        self.handle(message)
+                    else:
+                        self.handle(message, self.links[connection])
+                # announce everything received in this round together
+                self.flush_inventory()
+        finally:
+            self.node.stop()
+            thread.join()
+            for link in self.links.values():
+                link.close()
+            control.send_bytes(serialization.encode(self.stats()))
+
+
+def run_peer(index, connections, control, genesis, parameters, quiet=True):
+    # the entry point of a node's process
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull) if quiet else contextlib.nullcontext():
+            Peer(index, connections, genesis, **parameters).run(control)
+
+
+class Cluster:
+    # starts the nodes in processes, connects each one to degree peers (in a ring with random
+    # extra links, so that the nodes are always connected) and hands them transactions
+
+    def __init__(self, num_nodes, degree=4, latency=0.0, bandwidth=None, min_zeros_msb=4, block_size=100, seed=0, quiet=True, block_interval=None):
+        self.num_nodes = num_nodes
+        self.degree = degree
+        self.parameters = {'min_zeros_msb': min_zeros_msb, 'block_interval': block_interval, 'block_size': block_size, 'latency': latency, 'bandwidth': bandwidth}
+        self.random = random.Random(seed)
+        self.quiet = quiet
+        self.controls = []
+        self.processes = []
+
+    def edges(self):
+        edges = set()
+        if self.num_nodes > 1:
+            for i in range(self.num_nodes):
+                edges.add(tuple(sorted((i, (i + 1) % self.num_nodes))))
+        target = min(self.num_nodes * self.degree // 2, self.num_nodes * (self.num_nodes - 1) // 2)
+        while len(edges) < target:
+            i, j = self.random.sample(range(self.num_nodes), 2)
+            edges.add(tuple(sorted((i, j))))
+        return sorted(edges)
+
+    def start(self, genesis):
+        # start the nodes on a chain holding only the genesis block
+        connections = [[] for _ in range(self.num_nodes)]
+        for i, j in self.edges():
+            a, b = multiprocessing.Pipe()
+            connections[i].append(a)
+            connections[j].append(b)
+        for index in range(self.num_nodes):
+            control, remote = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_peer, args=(index, connections[index], remote, genesis.serialize(), self.parameters, self.quiet))
+            process.start()
+            self.controls.append(control)
+            self.processes.append(process)
+        # the processes hold their own copies of the pipes
+        for ends in connections:
+            for connection in ends:
+                connection.close()
+
+    def submit(self, transaction):
+        # hand a transaction to a random node, which gossips it to the others
+        self.random.choice(self.controls).send_bytes(b'T' + transaction.serialize())
+
+    def stats(self):
+        for control in self.controls:
+            control.send_bytes(b'Q')
+        return [serialization.decode(control.recv_bytes()) for control in self.controls]
+
+    def wait_for_transactions(self, count, timeout=None, interval=0.25):
+        # wait until every node has at least count transactions on its chain
+        # return the statistics of the nodes
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stats = self.stats()
+            if min(stat['transactions'] for stat in stats) >= count:
+                return stats
+            if deadline is not None and time.monotonic() > deadline:
+                return stats
+            time.sleep(interval)
+
+    def stop(self):
+        # stop the nodes and return their final statistics
+        for control in self.controls:
+            control.send_bytes(b'S')
+        stats = [serialization.decode(control.recv_bytes()) for control in self.controls]
+        for process in self.processes:
+            process.join()
+        return stats
@@ -6,29 +6,62 @@ import nacl.utils
 from nacl.signing import SigningKey
 from nacl.signing import VerifyKey
 from nacl.encoding import HexEncoder
+from nacl.exceptions import BadSignatureError, CryptoError
+from lru_cache import LRUCache
 
 import binascii
 
+# marks signatures that are not in the signature cache
+_NOT_CACHED = object()
+
 
 class User:
-    def __init__(self):
-        self.__private_key = SigningKey.generate()
+    # caches shared by every user in the process, so that each signature is only verified once
+    # deserialized public keys : {serialized public key : VerifyKey}
+    verify_key_cache = LRUCache(4096)
+    # verified signatures : {(serialized public key, signature) : signed message, or None if the signature is invalid}
+    signature_cache = LRUCache(65536)
+
+    def __init__(self, seed=None):
+        # a 32-byte seed gives the same keys every time (for reproducible workloads)
+        self.__private_key = SigningKey.generate() if seed is None else SigningKey(seed)
         self.public_key = self.__private_key.verify_key
 
     # signing functions
     def sign(self, message):
-        message = bytes(message, 'utf-8')
+        if type(message) == str:
+            message = bytes(message, 'utf-8')
         return self.__private_key.sign(message, encoder=HexEncoder).decode("utf-8")
 
     def verify_signature(public_key, signature):
-        signature = signature.encode("utf-8")
-        if type(public_key) != nacl.signing.VerifyKey:
-            verify_key = User.get_deserialized_public_key(public_key) 
+        # returns the signed message
         # raises nacl.exceptions.BadSignatureError if it fails
-        return verify_key.verify(signature, encoder=HexEncoder)
+        message = User.check_signature(public_key, signature)
+        if message is None:
+            raise BadSignatureError("Signature was forged or corrupt")
+        return message
+
+    def check_signature(public_key, signature):
+        # returns the signed message, or None if the signature is not valid for the public key
+        if type(public_key) == VerifyKey:
+            public_key = User.get_serialized_public_key(public_key)
+        key = (public_key, signature)
+        message = User.signature_cache.get(key, _NOT_CACHED)
+        if message is not _NOT_CACHED:
+            return message
+        try:
+            message = User.get_deserialized_public_key(public_key).verify(signature.encode("utf-8"), encoder=HexEncoder)
+        except (CryptoError, ValueError, TypeError):
+            message = None
+        User.signature_cache.put(key, message)
+        return message
 
     def get_serialized_public_key(public_key):
         return public_key.encode(encoder=HexEncoder).decode("utf-8")
 
     def get_deserialized_public_key(public_key):
-        return VerifyKey(public_key, encoder=HexEncoder)
\ No newline at end of file
+        verify_key = User.verify_key_cache.get(public_key)
+        if verify_key is None:
+            verify_key = VerifyKey(public_key, encoder=HexEncoder)
+            User.verify_key_cache.put(public_key, verify_key)
+        return verify_key
@@ -0,0 +1,52 @@
+# Description:
+# Defines an index of the outputs of the verified transactions. It is updated incrementally
+# as transactions are added to or rolled back from the verified transaction pool, so the
+# outputs referred to by an input can be found without scanning the blockchain.
+
+
+class UTXOSet:
+
+    def __init__(self):
+        # outputs of every verified transaction : {transaction id : {public key : amount}}
+        self.outputs = {}
+        # spent state of the verified outputs : {transaction id : id of the verified transaction that spent it}
+        self.spent = {}
+        # the genesis transaction pays several users, so its outputs can be spent by more than one transaction
+        self.genesis_id = None
+
+    def add(self, transaction):
+        # index the outputs of a newly verified transaction and mark its inputs as spent
+        id = transaction.id
+        if self.genesis_id is None and len(transaction.input) == 0:
+            self.genesis_id = id
+        self.outputs[id] = transaction.output
+        for input in transaction.input:
+            if input != self.genesis_id:
+                self.spent[input] = id
+
+    def remove(self, transaction):
+        # undo add when a transaction is rolled back from the verified transaction pool
+        id = transaction.id
+        self.outputs.pop(id, None)
+        for input in transaction.input:
+            if self.spent.get(input) == id:
+                self.spent.pop(input)
+        if id == self.genesis_id:
+            self.genesis_id = None
+
+    def get(self, id, default=None):
+        # get the outputs of a verified transaction, whether or not they have been spent
+        return self.outputs.get(id, default)
+
+    def spent_by(self, id):
+        # get the id of the verified transaction that spent the outputs of a transaction, if any
+        return self.spent.get(id)
+
+    def is_unspent(self, id):
+        return id in self.outputs and id not in self.spent
+
+    def __contains__(self, id):
+        return id in self.outputs
+
+    def __len__(self):
+        return len(self.outputs)